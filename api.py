@@ -1,7 +1,9 @@
-import openai
 import json
 import os
 import re
+from fault_localizer import format_fault, error_headline
+from llm_router import chat_completion, save_route
+from llm_transport import SimulatedLLMError
 
 PROMPT_MAP = {
     "Structure Error":
@@ -158,8 +160,44 @@ def clean_gpt_code(raw_text):
         return code_blocks[0].strip()
     return raw_text.strip()
 
-def run_error_repair(api_key, error_info_path, repair_dir):
-    openai.api_key = api_key
+# Ask GPT for a repair of one error group and save it as <repair_dir>/<error_code>.py.
+# With a localized fault the prompt carries the failing layer instead of the full error text;
+# `attempt` is the number of earlier rounds that failed on this group
+def generate_repair(api_key, error_type, error_code, error_msg, repair_dir, fault=None, attempt=0):
+    os.makedirs(repair_dir, exist_ok=True)
+
+    print(f"\n🟡 Processing {error_code} ({error_type})")
+    prompt_template = PROMPT_MAP.get(error_type, PROMPT_MAP["Other"])
+    if fault:
+        user_prompt = (f"{prompt_template}\n\n{error_headline(error_msg)}\n\n{format_fault(fault)}\n"
+                       f"Keep the rest of the architecture and fix only what this layer needs.")
+    else:
+        user_prompt = f"{prompt_template}\n\n{error_msg}"
+
+    # Call GPT on the model the router picks for this error category
+    raw_reply, model = chat_completion(
+        api_key, "repair", error_type,
+        messages=[
+            {"role": "system", "content": "You are a senior Keras model repair expert. You only return the fixed Python function code. No natural language or explanation is allowed."},
+            {"role": "user", "content": user_prompt}
+        ],
+        max_tokens=300,
+        attempt=attempt
+    )
+
+    # Extract clean code
+    clean_code = clean_gpt_code(raw_reply)
+
+    # Save repaired file, use error_code as filename
+    py_path = os.path.join(repair_dir, f"{error_code}.py")
+    with open(py_path, "w", encoding="utf-8") as f:
+        f.write(clean_code)
+    save_route(py_path, "repair", error_type, model)
+
+    print(f"✅ Repaired code saved: {py_path}")
+    return py_path
+
+def run_error_repair(api_key, error_info_path, repair_dir, attempt=0):
     os.makedirs(repair_dir, exist_ok=True)
 
     if not os.path.exists(error_info_path):
@@ -174,31 +212,13 @@ def run_error_repair(api_key, error_info_path, repair_dir):
             continue
 
         for error_code, error_entry in error_list.items():
-            error_msg = error_entry["message"]
-
-            print(f"\n🟡 Processing {error_code} ({error_type})")
-            prompt_template = PROMPT_MAP.get(error_type, PROMPT_MAP["Other"])
-            user_prompt = f"{prompt_template}\n\n{error_msg}"
-
-            # Call GPT
-            response = openai.ChatCompletion.create(
-                model="gpt-4-turbo",
-                messages=[
-                    {"role": "system", "content": "You are a senior Keras model repair expert. You only return the fixed Python function code. No natural language or explanation is allowed."},
-                    {"role": "user", "content": user_prompt}
-                ],
-                max_tokens=300
-            )
-
-            # Extract clean code
-            raw_reply = response["choices"][0]["message"]["content"]
-            clean_code = clean_gpt_code(raw_reply)
-
-            # Save repaired file, use error_code as filename
-            py_path = os.path.join(repair_dir, f"{error_code}.py")
-            with open(py_path, "w", encoding="utf-8") as f:
-                f.write(clean_code)
-
-            print(f"✅ Repaired code saved: {py_path}")
+            # Models in a group share the normalized error, so one fault stands for the group
+            faults = error_entry.get("faults") or {}
+            fault = next(iter(faults.values()), None)
+            try:
+                generate_repair(api_key, error_type, error_code, error_entry["message"], repair_dir, fault, attempt)
+            except SimulatedLLMError as e:
+                # The group's models are then reported as missing their repair script; real API errors still stop the run
+                print(f"❌ Failed to generate repair for {error_code}: {e}")
 
     print("\n🎉 All repair code has been generated.")
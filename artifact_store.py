@@ -0,0 +1,222 @@
+import os
+import sys
+import json
+import time
+import shutil
+from contextlib import contextmanager
+from file_lock import file_lock
+from verdict_cache import file_digest
+
+# Content-addressed store for .h5/.pkl artifacts. Every file is kept once under
+# blobs/<digest[:2]>/<digest><ext>; which stage a model is in lives in index.json.
+# The stage folders (gpt_input, output_files, ...) are only hardlinked views.
+STORE_ROOT = "artifacts"
+STAGE_DIRS = {
+    "input": "input_files",
+    "gpt_input": "gpt_input",
+    "output": "output_files",
+    "failure": "failure_files",
+}
+VIEWS_ENABLED = os.environ.get("DELTA_STAGE_VIEWS", "1") != "0"
+
+KIND_EXT = {"h5": ".h5", "pkl": ".pkl"}
+
+
+def _index_path(root):
+    return os.path.join(root, "index.json")
+
+
+def blob_path(digest, kind, root=STORE_ROOT):
+    return os.path.join(root, "blobs", digest[:2], digest + KIND_EXT[kind])
+
+
+# Scratch location for files that are about to be added to the store
+def work_path(name, root=STORE_ROOT):
+    work_dir = os.path.join(root, "work", str(os.getpid()))
+    os.makedirs(work_dir, exist_ok=True)
+    return os.path.join(work_dir, name)
+
+
+def pkl_name(name):
+    return name.replace(".h5", ".pkl")
+
+
+def load_index(root=STORE_ROOT):
+    path = _index_path(root)
+    if not os.path.exists(path):
+        return {"models": {}}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+# Read-modify-write of the index under the store lock, replaced atomically
+@contextmanager
+def _edit_index(root=STORE_ROOT):
+    os.makedirs(root, exist_ok=True)
+    with file_lock(os.path.join(root, ".lock")):
+        index = load_index(root)
+        yield index
+        tmp_path = _index_path(root) + f".{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(index, f, indent=2, ensure_ascii=False)
+        os.replace(tmp_path, _index_path(root))
+
+
+# Store a file by content; identical files are stored only once
+def put_blob(path, kind, root=STORE_ROOT):
+    digest = file_digest(path)
+    if digest is None:
+        raise FileNotFoundError(f"Cannot store missing file: {path}")
+    target = blob_path(digest, kind, root)
+    if not os.path.exists(target):
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        tmp_path = f"{target}.{os.getpid()}.tmp"
+        shutil.copyfile(path, tmp_path)
+        os.chmod(tmp_path, 0o444)  # blobs are shared by views, never modify in place
+        os.replace(tmp_path, target)
+    return digest
+
+
+# Add or replace the .h5/.pkl of a model; `remove_source` consumes the original file
+def add_artifact(name, kind, path, root=STORE_ROOT, remove_source=False):
+    digest = put_blob(path, kind, root)
+    set_artifact(name, kind, digest, root)
+    if remove_source:
+        os.remove(path)
+    return digest
+
+
+# Point a model at a blob that is already in the store
+def set_artifact(name, kind, digest, root=STORE_ROOT):
+    with _edit_index(root) as index:
+        entry = index["models"].setdefault(name, {"h5": None, "pkl": None, "stage": "input", "view": None})
+        entry[kind] = digest
+        entry["updated"] = time.time()
+
+
+# Safe to repeat: a source already consumed by an earlier registration is taken from the index
+# A fresh .h5 replaces the whole model: without a .pkl next to it, no earlier input is kept
+def register_model(name, h5_path, pkl_path=None, stage="input", root=STORE_ROOT, remove_source=False):
+    entry = load_index(root)["models"].get(name) or {}
+    fresh = os.path.exists(h5_path) or not entry.get("h5")
+    if fresh:
+        add_artifact(name, "h5", h5_path, root, remove_source)
+    else:
+        print(f"♻️ {name} was already registered, using the stored copy")
+    if pkl_path and os.path.exists(pkl_path):
+        add_artifact(name, "pkl", pkl_path, root, remove_source)
+    elif fresh:
+        set_artifact(name, "pkl", None, root)
+
+    with _edit_index(root) as index:
+        entry = index["models"][name]
+        previous_view = entry.get("view") if fresh else None
+        entry["stage"] = stage
+        if previous_view:
+            entry["view"] = None
+    if previous_view:
+        _remove_view(previous_view, name)
+
+
+# Adopt a model left in a stage folder by a run from before the store existed.
+# Returns False if the model is neither indexed nor in that folder.
+def ensure_registered(name, stage, view_dir=None, root=STORE_ROOT):
+    if name in load_index(root)["models"]:
+        return True
+    view_dir = view_dir or STAGE_DIRS[stage]
+    h5_path = os.path.join(view_dir, name)
+    if not os.path.exists(h5_path):
+        return False
+    register_model(name, h5_path, os.path.join(view_dir, pkl_name(name)), stage, root)
+    move_to_stage(name, stage, view_dir, root)
+    print(f"📥 Registered {name} from {view_dir} in the artifact store")
+    return True
+
+
+# Path of the stored blob for a model, or None if it has no such artifact
+def artifact_path(name, kind, root=STORE_ROOT):
+    entry = load_index(root)["models"].get(name)
+    if not entry or not entry.get(kind):
+        return None
+    return blob_path(entry[kind], kind, root)
+
+
+def get_stage(name, root=STORE_ROOT):
+    entry = load_index(root)["models"].get(name)
+    return entry["stage"] if entry else None
+
+
+def list_stage(stage, root=STORE_ROOT):
+    return sorted(name for name, entry in load_index(root)["models"].items() if entry["stage"] == stage)
+
+
+def count_stage(stage, root=STORE_ROOT):
+    return len(list_stage(stage, root))
+
+
+def _remove_view(view_dir, name):
+    for file in (name, pkl_name(name)):
+        path = os.path.join(view_dir, file)
+        if os.path.lexists(path):
+            os.remove(path)
+
+
+def _link(src, dst):
+    if os.path.lexists(dst):
+        os.remove(dst)
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copyfile(src, dst)  # e.g. view on another filesystem
+
+
+# Expose a model's blobs as <view_dir>/<name> and <view_dir>/<name>.pkl
+def _place_view(entry, name, view_dir, root):
+    os.makedirs(view_dir, exist_ok=True)
+    _link(blob_path(entry["h5"], "h5", root), os.path.join(view_dir, name))
+    if entry.get("pkl"):
+        _link(blob_path(entry["pkl"], "pkl", root), os.path.join(view_dir, pkl_name(name)))
+
+
+# Record a stage transition; the folder view is updated only when views are enabled
+def move_to_stage(name, stage, view_dir=None, root=STORE_ROOT):
+    view_dir = view_dir or STAGE_DIRS[stage]
+    with _edit_index(root) as index:
+        entry = index["models"][name]
+        previous_view = entry.get("view")
+        entry["stage"] = stage
+        entry["view"] = view_dir if VIEWS_ENABLED else None
+        entry["updated"] = time.time()
+
+    if previous_view and os.path.abspath(previous_view) != os.path.abspath(view_dir):
+        _remove_view(previous_view, name)
+    if VIEWS_ENABLED:
+        _place_view(entry, name, view_dir, root)
+
+
+# Rebuild every stage folder from the index (e.g. after a run with views disabled)
+def export_views(root=STORE_ROOT, stage_dirs=STAGE_DIRS):
+    with _edit_index(root) as index:
+        for name, entry in index["models"].items():
+            view_dir = stage_dirs[entry["stage"]]
+            if entry.get("view") and os.path.abspath(entry["view"]) != os.path.abspath(view_dir):
+                _remove_view(entry["view"], name)
+            _place_view(entry, name, view_dir, root)
+            entry["view"] = view_dir
+    print(f"📁 Stage views exported from {root}")
+
+
+def print_status(root=STORE_ROOT):
+    index = load_index(root)
+    blobs = {(e["h5"], "h5") for e in index["models"].values() if e["h5"]}
+    blobs |= {(e["pkl"], "pkl") for e in index["models"].values() if e.get("pkl")}
+    print(f"📦 {len(index['models'])} models, {len(blobs)} unique blobs")
+    for stage in STAGE_DIRS:
+        print(f"  {stage}: {count_stage(stage, root)}")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "export":
+        export_views()
+    else:
+        print_status()
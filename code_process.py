@@ -1,14 +1,20 @@
 import os
-import shutil
 import json
 import re
+import time
 import importlib.util
 from collections import defaultdict
 from keras.models import load_model
 from test import test_model
 from api import run_error_repair
 from input_generation import process_no_input_errors
-from input_process import process_files
+from input_process import process_files, format_error_dict
+from verdict_cache import cached_validation, repair_key, get_entry, put_entry
+from differential import differential_validate_stage
+from artifact_store import add_artifact, artifact_path, move_to_stage, work_path, set_artifact, blob_path, ensure_registered
+from profiling import profiled, attach_verdict
+from fault_localizer import localize_model
+from llm_router import record_script_outcome
 
 # -------- Error Classification and Cleaning Functions -------- #
 def classify_error(error_msg):
@@ -38,12 +44,135 @@ def load_repair_function(py_file_path):
     spec.loader.exec_module(module)
     return getattr(module, "build_fixed_model", None)
 
+# Load and test a repaired model; returns (result, error_type, fault), error_type is None on success
+def validate_repaired_model(h5_path, pkl_path, file=None):
+    try:
+        with profiled("load_model", file):
+            load_model(h5_path)
+    except Exception as e:
+        err_msg = f"Model loading failed: {str(e)}"
+        return err_msg, classify_error(err_msg), None
+
+    if not pkl_path or not os.path.exists(pkl_path):
+        return "Missing .pkl input file", "No Input Error", None
+
+    result = test_model(h5_path, pkl_path, model_name=file)
+    if result == "Success":
+        return result, None, None
+    fault = localize_model(h5_path, pkl_path) if result.startswith("Error during prediction") else None
+    return result, classify_error(result), fault
+
+# Build with the repair function, store and validate the repaired model.
+# Returns (result, error_type, fault, repaired .h5 digest or None if the build failed)
+def _build_and_validate(file, build_model_fn, pkl_path):
+    try:
+        with profiled("build_fn", file):
+            model = build_model_fn()
+            save_path = work_path(file)
+            model.save(save_path)
+        # Identical repaired models end up as a single blob in the store
+        digest = add_artifact(file, "h5", save_path, remove_source=True)
+    except Exception as e:
+        err_msg = f"Failed to execute repair function: {str(e)}"
+        return err_msg, classify_error(err_msg), None, None
+
+    h5_path = artifact_path(file, "h5")
+    result, err_type, fault = cached_validation(h5_path, pkl_path, lambda: validate_repaired_model(h5_path, pkl_path, file))
+    return result, err_type, fault, digest
+
+# Rebuild one model with a repair function and validate it. With `repair_path` the verdict
+# is cached per (script, input) and a hit skips building the model altogether.
+# Returns None on success, otherwise (error_type, normalized_message, fault)
+def apply_repair(file, build_model_fn,
+                 gpt_input_dir="gpt_input",
+                 output_dir="output_files",
+                 failure_dir=None,
+                 failure_info_path=None,
+                 repair_path=None):
+    ensure_registered(file, "gpt_input", gpt_input_dir)
+    pkl_path = artifact_path(file, "pkl")
+    key = repair_key(repair_path, pkl_path) if repair_path else None
+    cached = get_entry(key)
+    # A cached success is only usable while its repaired model is still in the store
+    if cached and (cached["h5"] is None or os.path.exists(blob_path(cached["h5"], "h5"))):
+        print(f"💾 Cached repair verdict for {file} ({cached['duration']:.2f}s saved)")
+        result, err_type, fault, digest = cached["result"], cached["error_type"], cached.get("fault"), cached["h5"]
+        if digest:
+            set_artifact(file, "h5", digest)
+    else:
+        start = time.time()
+        result, err_type, fault, digest = _build_and_validate(file, build_model_fn, pkl_path)
+        put_entry(key, {"result": result, "error_type": err_type, "duration": round(time.time() - start, 4),
+                        "model": file, "fault": fault, "h5": digest,
+                        "script": os.path.basename(repair_path) if repair_path else None})
+    attach_verdict(file, result, err_type)
+
+    # The build itself failed: nothing new to stage
+    if digest is None:
+        return err_type, normalize_error_message(result), None
+
+    if result == "Success":
+        move_to_stage(file, "output", output_dir)
+        return None
+
+    # Models that could not be loaded or have no input stay in gpt_input
+    if failure_dir and failure_info_path and err_type != "No Input Error" \
+            and not result.startswith("Model loading failed"):
+        move_to_stage(file, "failure", failure_dir)
+    else:
+        move_to_stage(file, "gpt_input", gpt_input_dir)
+    return err_type, normalize_error_message(result), fault
+
+# Returns (build_fixed_model, None), or (None, failure) if the script is missing or unusable
+def load_repair_script(repair_path):
+    if not os.path.exists(repair_path):
+        print(f"⚠️ Missing repair script: {repair_path}")
+        return None, ("Other Error", "Missing repair script", None)
+
+    try:
+        build_model_fn = load_repair_function(repair_path)
+    except Exception as e:
+        print(f"❌ Repair script does not run: {repair_path}: {e}")
+        build_model_fn = None
+    if not build_model_fn:
+        print(f"❌ Failed to load repair function: {repair_path}")
+        return None, (classify_error("Failed to load repair function"),
+                      normalize_error_message("Failed to load repair function"), None)
+    return build_model_fn, None
+
+# Repair every model of an error group with one script, loaded once.
+# Returns {file: None on success, otherwise (error_type, normalized_message, fault)}
+def repair_group(files, repair_path,
+                 gpt_input_dir="gpt_input",
+                 output_dir="output_files",
+                 failure_dir=None,
+                 failure_info_path=None):
+    build_model_fn, load_failure = load_repair_script(repair_path)
+    failures = {}
+    for file in files:
+        if load_failure:
+            failures[file] = load_failure
+        else:
+            failures[file] = apply_repair(file, build_model_fn, gpt_input_dir, output_dir, failure_dir,
+                                          failure_info_path, repair_path)
+        record_script_outcome(repair_path, failures[file] is None)
+    return failures
+
+# One model's share of process_repair, as run by a distributed worker
+def repair_from_script(file, repair_path,
+                       gpt_input_dir="gpt_input",
+                       output_dir="output_files",
+                       failure_dir=None,
+                       failure_info_path=None):
+    return repair_group([file], repair_path, gpt_input_dir, output_dir, failure_dir, failure_info_path)[file]
+
 # -------- Main Repair Pipeline -------- #
 def process_repair(error_info_path, repair_dir,
                    gpt_input_dir="gpt_input",
                    output_dir="output_files",
                    failure_dir=None,
-                   failure_info_path=None):
+                   failure_info_path=None,
+                   fail_info_path="fail_error_info.json"):
     os.makedirs(output_dir, exist_ok=True)
     os.makedirs(gpt_input_dir, exist_ok=True)
     if failure_dir:
@@ -57,95 +186,47 @@ def process_repair(error_info_path, repair_dir,
         error_info = json.load(f)
 
     error_dict = defaultdict(lambda: defaultdict(set))
+    faults = {}
 
     for error_type, group in error_info.items():
         if error_type == "No Input Error":
             continue
 
         for error_code, data in group.items():
-            message = data["message"]
-            models = data["models"]
             repair_path = os.path.join(repair_dir, f"{error_code}.py")
-
-            if not os.path.exists(repair_path):
-                print(f"⚠️ Missing repair script: {repair_path}")
-                for file in models:
-                    error_dict["Other Error"]["Missing repair script"].add(file)
-                continue
-
-            build_model_fn = load_repair_function(repair_path)
-            if not build_model_fn:
-                print(f"❌ Failed to load repair function: {repair_path}")
-                for file in models:
-                    err_type = classify_error("Failed to load repair function")
-                    norm = normalize_error_message("Failed to load repair function")
-                    error_dict[err_type][norm].add(file)
-                continue
-
-            for file in models:
-                h5_path = os.path.join(gpt_input_dir, file)
-                pkl_path = h5_path.replace(".h5", ".pkl")
-
-                try:
-                    model = build_model_fn()
-                    model.save(h5_path)
-                except Exception as e:
-                    err_msg = f"Failed to execute repair function: {str(e)}"
-                    err_type = classify_error(err_msg)
-                    norm = normalize_error_message(err_msg)
-                    error_dict[err_type][norm].add(file)
-                    continue
-
-                try:
-                    load_model(h5_path)
-                except Exception as e:
-                    err_msg = f"Model loading failed: {str(e)}"
-                    err_type = classify_error(err_msg)
-                    norm = normalize_error_message(err_msg)
-                    error_dict[err_type][norm].add(file)
-                    continue
-
-                if not os.path.exists(pkl_path):
-                    error_dict["No Input Error"]["Missing .pkl input file"].add(file)
-                    continue
-
-                result = test_model(h5_path, pkl_path)
-                if result == "Success":
-                    shutil.move(h5_path, os.path.join(output_dir, file))
-                    shutil.move(pkl_path, os.path.join(output_dir, os.path.basename(pkl_path)))
-                else:
-                    if failure_dir and failure_info_path:
-                        shutil.move(h5_path, os.path.join(failure_dir, file))
-                        if os.path.exists(pkl_path):
-                            shutil.move(pkl_path, os.path.join(failure_dir, os.path.basename(pkl_path)))
-                    err_type = classify_error(result)
-                    norm = normalize_error_message(result)
+            failures = repair_group(data["models"], repair_path, gpt_input_dir, output_dir,
+                                    failure_dir, failure_info_path)
+            for file, failure in failures.items():
+                if failure:
+                    err_type, norm, faults[file] = failure
                     error_dict[err_type][norm].add(file)
 
-    formatted_error_dict = {}
-    for etype, details in error_dict.items():
-        type_counter = 1
-        formatted_error_dict[etype] = {}
-        for msg, models in details.items():
-            key = f"{etype.lower().replace(' ', '')}{type_counter}"
-            formatted_error_dict[etype][key] = {
-                "message": msg,
-                "models": list(models)
-            }
-            type_counter += 1
-
-    out_path = failure_info_path if failure_info_path else "fail_error_info.json"
+    formatted_error_dict = format_error_dict(error_dict, faults)
+
+    out_path = failure_info_path if failure_info_path else fail_info_path
     with open(out_path, "w", encoding="utf-8") as f:
         json.dump(formatted_error_dict, f, indent=2, ensure_ascii=False)
 
     print(f"✅ Repair attempts completed. Error records written to {out_path}")
 
+# Two repair rounds over an error_info file; the second round only sees what the first could not fix,
+# so the router may escalate it to a stronger model
+def run_repair_rounds(api_key, error_info_path="error_info.json",
+                      fail_info_path="fail_error_info.json",
+                      failure_info_path="failure_info.json",
+                      repair_dirs=("repairs", "repairs2")):
+    process_no_input_errors(api_key, error_info_path=error_info_path, gpt_input_dir="gpt_input", output_dir="output_files")
+    run_error_repair(api_key, error_info_path=error_info_path, repair_dir=repair_dirs[0])
+    process_repair(error_info_path, repair_dirs[0], fail_info_path=fail_info_path)
+    process_no_input_errors(api_key, error_info_path=fail_info_path, gpt_input_dir="gpt_input", output_dir="output_files", attempt=1)
+    run_error_repair(api_key, error_info_path=fail_info_path, repair_dir=repair_dirs[1], attempt=1)
+    process_repair(fail_info_path, repair_dirs[1], failure_dir="failure_files", failure_info_path=failure_info_path)
+
 # -------- Main Entry Point -------- #
-def run_full_pipeline(api_key):
+def run_full_pipeline(api_key, differential=False):
     process_files(input_dir="input_files", output_dir="output_files", gpt_input_dir="gpt_input")
-    process_no_input_errors(api_key, error_info_path="error_info.json", gpt_input_dir="gpt_input", output_dir="output_files")
-    run_error_repair(api_key, error_info_path="error_info.json", repair_dir="repairs")
-    process_repair("error_info.json", "repairs")
-    process_no_input_errors(api_key, error_info_path="fail_error_info.json", gpt_input_dir="gpt_input", output_dir="output_files")
-    run_error_repair(api_key, error_info_path="fail_error_info.json", repair_dir="repairs2")
-    process_repair("fail_error_info.json", "repairs2", failure_dir="failure_files", failure_info_path="failure_info.json")
+    run_repair_rounds(api_key)
+
+    # Optionally re-run the repaired models on every Keras backend to surface library bugs
+    if differential:
+        differential_validate_stage("output")
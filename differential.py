@@ -0,0 +1,305 @@
+import os
+import json
+import time
+import pickle
+import argparse
+import tempfile
+import numpy as np
+import multiprocessing as mp
+from queue import Empty
+from artifact_store import list_stage, artifact_path, STAGE_DIRS
+
+# Keras must not be imported at module level here: every worker process selects its
+# backend through KERAS_BACKEND, which is only honoured before the first keras import.
+BACKENDS = ("tensorflow", "torch", "jax")
+DEFAULT_RTOL = 1e-3
+DEFAULT_ATOL = 1e-4
+DEFAULT_TIMEOUT = 600
+POLL_INTERVAL = 1.0
+
+# Decode a .pkl input exactly as test_model does
+def decode_input(pkl_path):
+    with open(pkl_path, "rb") as f:
+        input_data = pickle.load(f)
+
+    if isinstance(input_data, dict):
+        input_data = list(input_data.values())[0]
+    if not isinstance(input_data, np.ndarray):
+        input_data = np.array(input_data)
+    input_data = input_data.astype("float32") / 255.0
+    return np.ascontiguousarray(input_data)
+
+# Long-lived process pinned to one backend: imports Keras once, then serves
+# (job_id, model_path, input_path) jobs until it receives None. The input is a shared
+# copy-on-write memmap.
+def _backend_server(backend, job_queue, result_queue):
+    os.environ["KERAS_BACKEND"] = backend
+    try:
+        import keras
+    except ImportError as e:
+        result_queue.put((backend, None, f"{type(e).__name__}: {e}", None, 0.0))
+        return
+    result_queue.put((backend, None, "Ready", None, 0.0))
+
+    while True:
+        job = job_queue.get()
+        if job is None:
+            return
+        job_id, model_path, input_path = job
+        start = time.time()
+        try:
+            input_data = np.load(input_path, mmap_mode="c")
+            model = keras.models.load_model(model_path)
+            predictions = model.predict(input_data, verbose=0)
+            if isinstance(predictions, (list, tuple)):
+                outputs = [np.asarray(p) for p in predictions]
+            else:
+                outputs = [np.asarray(predictions)]
+            result_queue.put((backend, job_id, "Success", outputs, time.time() - start))
+        except Exception as e:
+            result_queue.put((backend, job_id, f"{type(e).__name__}: {e}", None, time.time() - start))
+        finally:
+            keras.backend.clear_session()
+
+
+def _spawn_server(pool, backend):
+    jobs = pool["ctx"].Queue()
+    previous_backend = os.environ.get("KERAS_BACKEND")
+    try:
+        # The child inherits the environment at spawn time, before it imports anything
+        os.environ["KERAS_BACKEND"] = backend
+        p = pool["ctx"].Process(target=_backend_server, args=(backend, jobs, pool["results"]), daemon=True)
+        p.start()
+    finally:
+        if previous_backend is None:
+            os.environ.pop("KERAS_BACKEND", None)
+        else:
+            os.environ["KERAS_BACKEND"] = previous_backend
+    pool["servers"][backend] = {"process": p, "jobs": jobs}
+
+
+def _stop_server(pool, backend):
+    server = pool["servers"].pop(backend)
+    server["jobs"].put(None)
+    server["process"].join(timeout=5)
+    if server["process"].is_alive():
+        server["process"].terminate()
+
+
+# Replace a worker that died or hung; the new one imports Keras while the next job waits
+def _restart_server(pool, backend):
+    server = pool["servers"].pop(backend)
+    if server["process"].is_alive():
+        server["process"].terminate()
+    _spawn_server(pool, backend)
+
+
+def _is_environment_error(result):
+    return result.startswith(("ImportError", "ModuleNotFoundError"))
+
+
+# Start one worker per backend and wait until each has imported Keras. Backends that
+# cannot be imported are left out and listed in pool["unavailable"].
+def start_backend_pool(backends=BACKENDS, timeout=DEFAULT_TIMEOUT):
+    ctx = mp.get_context("spawn")
+    pool = {"ctx": ctx, "results": ctx.Queue(), "servers": {}, "unavailable": {}, "next_job": 0}
+    for backend in backends:
+        _spawn_server(pool, backend)
+
+    pending = set(backends)
+    deadline = time.time() + timeout
+    while pending and time.time() < deadline:
+        try:
+            backend, _, result, _, _ = pool["results"].get(timeout=POLL_INTERVAL)
+        except Empty:
+            for backend in list(pending):
+                exitcode = pool["servers"][backend]["process"].exitcode
+                if exitcode is not None:
+                    pool["unavailable"][backend] = f"Worker exited with code {exitcode} while importing Keras"
+                    pending.discard(backend)
+            continue
+        pending.discard(backend)
+        if result != "Ready":
+            pool["unavailable"][backend] = result
+    for backend in pending:
+        pool["unavailable"][backend] = f"Keras import took longer than {timeout}s"
+
+    for backend, reason in pool["unavailable"].items():
+        print(f"⚠️ Backend {backend} unavailable, skipping it: {reason}")
+        _stop_server(pool, backend)
+    return pool
+
+
+def stop_backend_pool(pool):
+    for backend in list(pool["servers"]):
+        _stop_server(pool, backend)
+
+
+# Compare one backend's outputs against the reference; returns (consistent, max_abs_diff, detail)
+def compare_outputs(reference, candidate, rtol=DEFAULT_RTOL, atol=DEFAULT_ATOL):
+    if len(reference) != len(candidate):
+        return False, None, f"number of outputs differs: {len(reference)} vs {len(candidate)}"
+
+    max_diff = 0.0
+    for i, (ref, cand) in enumerate(zip(reference, candidate)):
+        if ref.shape != cand.shape:
+            return False, None, f"output {i} shape differs: {ref.shape} vs {cand.shape}"
+        ref = ref.astype(np.float64)
+        cand = cand.astype(np.float64)
+        if not np.array_equal(np.isnan(ref), np.isnan(cand)) or not np.array_equal(np.isinf(ref), np.isinf(cand)):
+            return False, None, f"output {i} has NaN/Inf at different positions"
+        finite = np.isfinite(ref)
+        if finite.any():
+            max_diff = max(max_diff, float(np.max(np.abs(ref[finite] - cand[finite]))))
+        if not np.allclose(ref, cand, rtol=rtol, atol=atol, equal_nan=True):
+            return False, max_diff, f"output {i} exceeds tolerance (rtol={rtol}, atol={atol})"
+    return True, max_diff, None
+
+# Run one model on every backend concurrently and compare the results. Pass a pool from
+# start_backend_pool to reuse its workers; otherwise one is started for this model only.
+def differential_test_model(model_path, pkl_path, backends=BACKENDS,
+                            rtol=DEFAULT_RTOL, atol=DEFAULT_ATOL, timeout=DEFAULT_TIMEOUT, model_name=None,
+                            pool=None):
+    own_pool = pool is None
+    if own_pool:
+        pool = start_backend_pool(backends, timeout)
+    try:
+        return _differential_run(pool, model_path, pkl_path, backends, rtol, atol, timeout, model_name)
+    finally:
+        if own_pool:
+            stop_backend_pool(pool)
+
+
+def _differential_run(pool, model_path, pkl_path, backends, rtol, atol, timeout, model_name):
+    start = time.time()
+    backends = [b for b in backends if b in pool["servers"]]
+    input_data = decode_input(pkl_path)
+
+    # Decode once, share the array with every worker through the page cache
+    fd, input_path = tempfile.mkstemp(suffix=".npy")
+    os.close(fd)
+    np.save(input_path, input_data)
+
+    pool["next_job"] += 1
+    job_id = pool["next_job"]
+    for backend in backends:
+        pool["servers"][backend]["jobs"].put((job_id, model_path, input_path))
+
+    results = {}
+    try:
+        deadline = time.time() + timeout
+        while len(results) < len(backends) and time.time() < deadline:
+            try:
+                backend, result_id, result, outputs, duration = pool["results"].get(timeout=POLL_INTERVAL)
+            except Empty:
+                # A worker killed by a segfault or the OOM killer never reports back
+                for backend in backends:
+                    exitcode = pool["servers"][backend]["process"].exitcode
+                    if backend not in results and exitcode is not None:
+                        results[backend] = {"result": f"Worker died (exit code {exitcode})",
+                                            "outputs": None, "duration": None}
+                        _restart_server(pool, backend)
+                continue
+            # Skip readiness messages of restarted workers and results of abandoned jobs
+            if result_id == job_id:
+                results[backend] = {"result": result, "outputs": outputs, "duration": round(duration, 4)}
+    finally:
+        os.remove(input_path)
+
+    for backend in backends:
+        if backend not in results:
+            results[backend] = {"result": f"Timeout after {timeout}s", "outputs": None, "duration": None}
+            _restart_server(pool, backend)
+
+    verdict = {
+        "model": model_name or os.path.basename(model_path),
+        "backends": {b: {"result": results[b]["result"], "duration": results[b]["duration"]} for b in backends},
+        "wall_time": round(time.time() - start, 4),
+    }
+    if pool["unavailable"]:
+        verdict["skipped_backends"] = sorted(pool["unavailable"])
+
+    # A backend missing a package says nothing about the library or the script
+    compared = [b for b in backends if not _is_environment_error(results[b]["result"])]
+    succeeded = [b for b in compared if results[b]["result"] == "Success"]
+    if len(compared) < 2:
+        verdict["status"] = "Environment Error"
+        return verdict
+    if not succeeded:
+        # Fails everywhere: the script itself is invalid, not a library bug
+        verdict["status"] = "Script Error"
+        return verdict
+    if len(succeeded) < len(compared):
+        verdict["status"] = "Backend Crash"
+        return verdict
+
+    reference = results[compared[0]]["outputs"]
+    verdict["status"] = "Consistent"
+    verdict["max_abs_diff"] = {}
+    for backend in compared[1:]:
+        consistent, max_diff, detail = compare_outputs(reference, results[backend]["outputs"], rtol, atol)
+        verdict["max_abs_diff"][backend] = max_diff
+        if not consistent:
+            verdict["status"] = "Inconsistency"
+            verdict.setdefault("details", {})[backend] = detail
+    return verdict
+
+# Validate every model of a stage and record candidate library bugs
+def differential_validate_stage(stage="output", backends=BACKENDS,
+                                rtol=DEFAULT_RTOL, atol=DEFAULT_ATOL,
+                                report_path="differential_info.json"):
+    if stage not in STAGE_DIRS:
+        raise ValueError(f"Unknown stage {stage!r}, expected one of: {', '.join(STAGE_DIRS)}")
+    report = {}
+    # One long-lived worker per backend for the whole stage, so Keras is imported once per backend
+    pool = start_backend_pool(backends)
+    try:
+        _validate_stage(pool, stage, backends, rtol, atol, report)
+    finally:
+        stop_backend_pool(pool)
+    if pool["unavailable"]:
+        report["Unavailable Backends"] = pool["unavailable"]
+
+    with open(report_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"📌 Differential results written to {report_path}")
+    return report
+
+
+def _validate_stage(pool, stage, backends, rtol, atol, report):
+    if len(pool["servers"]) < 2:
+        print(f"❌ Differential testing needs at least two usable backends, found {len(pool['servers'])}")
+        return
+    for file in list_stage(stage):
+        h5_path = artifact_path(file, "h5")
+        pkl_path = artifact_path(file, "pkl")
+        if not pkl_path:
+            print(f"⚠️ Skipping {file}: missing .pkl input file")
+            continue
+
+        print(f"\n🔀 Differential testing {file} on {', '.join(backends)}")
+        verdict = differential_test_model(h5_path, pkl_path, backends, rtol, atol, model_name=file, pool=pool)
+        status = verdict.pop("status")
+        report.setdefault(status, {})[file] = verdict
+
+        if status in ("Inconsistency", "Backend Crash"):
+            print(f"🐞 {status} (candidate library bug): {file}")
+        elif status == "Script Error":
+            print(f"❌ Fails on every backend (script error): {file}")
+        elif status == "Environment Error":
+            print(f"⚠️ Fewer than two backends could run it (missing packages): {file}")
+        else:
+            print(f"✅ Consistent across backends ({verdict['wall_time']:.2f}s)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Cross-backend differential validation of repaired models")
+    parser.add_argument("stage", nargs="?", default="output", choices=list(STAGE_DIRS))
+    parser.add_argument("--backends", default=",".join(BACKENDS))
+    parser.add_argument("--rtol", type=float, default=DEFAULT_RTOL)
+    parser.add_argument("--atol", type=float, default=DEFAULT_ATOL)
+    parser.add_argument("--report", default="differential_info.json")
+    args = parser.parse_args()
+
+    differential_validate_stage(args.stage, tuple(args.backends.split(",")),
+                              args.rtol, args.atol, args.report)
@@ -0,0 +1,128 @@
+import os
+import gzip
+import time
+import hashlib
+import numpy as np
+from file_lock import file_lock
+
+# Columnar store of prediction digests: one append-only file per column,
+# fixed-width binary for numeric columns and one line per row for text columns
+DIGEST_STORE = "prediction_digests"
+# DELTA_SAVE_RAW_OUTPUTS=1 also keeps every raw output array, for runs that need to inspect them
+SAVE_RAW = os.environ.get("DELTA_SAVE_RAW_OUTPUTS") == "1"
+QUANT_DECIMALS = 4
+
+COLUMNS = {
+    "timestamp": np.float64,
+    "model": str,
+    "output_index": np.int64,
+    "shape": str,
+    "dtype": str,
+    "nan_count": np.int64,
+    "inf_count": np.int64,
+    "min": np.float64,
+    "max": np.float64,
+    "mean": np.float64,
+    "qhash": str,
+    "raw_path": str,
+}
+
+def _column_path(store_dir, column):
+    ext = "txt" if COLUMNS[column] is str else np.dtype(COLUMNS[column]).name
+    return os.path.join(store_dir, f"{column}.{ext}")
+
+# Compact summary of one output array; the hash is taken after rounding so that
+# tiny floating point noise between runs does not change it
+def prediction_digest(output, decimals=QUANT_DECIMALS):
+    arr = np.asarray(output)
+    values = arr.astype(np.float64, copy=False)
+    nan_mask = np.isnan(values)
+    inf_mask = np.isinf(values)
+    finite = values[~(nan_mask | inf_mask)]
+
+    quantized = np.round(values, decimals) + 0.0  # + 0.0 folds -0.0 into 0.0
+    quantized[nan_mask] = np.nan
+    h = hashlib.sha1(str(arr.shape).encode())
+    h.update(np.ascontiguousarray(quantized).tobytes())
+
+    return {
+        "shape": str(tuple(arr.shape)),
+        "dtype": str(arr.dtype),
+        "nan_count": int(nan_mask.sum()),
+        "inf_count": int(inf_mask.sum()),
+        "min": float(finite.min()) if finite.size else float("nan"),
+        "max": float(finite.max()) if finite.size else float("nan"),
+        "mean": float(finite.mean()) if finite.size else float("nan"),
+        "qhash": h.hexdigest(),
+    }
+
+# Multi-output models return a list of arrays; digest each output separately
+def digest_predictions(predictions, decimals=QUANT_DECIMALS):
+    outputs = predictions if isinstance(predictions, (list, tuple)) else [predictions]
+    return [prediction_digest(o, decimals) for o in outputs]
+
+def format_digest(digest):
+    return (f"shape={digest['shape']} dtype={digest['dtype']} nan={digest['nan_count']} inf={digest['inf_count']} "
+            f"min={digest['min']:.4g} max={digest['max']:.4g} mean={digest['mean']:.4g} hash={digest['qhash'][:12]}")
+
+# Save the raw outputs as gzip-compressed .npy files, one per output
+def save_raw_outputs(model_name, predictions, store_dir=DIGEST_STORE):
+    raw_dir = os.path.join(store_dir, "raw")
+    os.makedirs(raw_dir, exist_ok=True)
+    outputs = predictions if isinstance(predictions, (list, tuple)) else [predictions]
+    stem = f"{os.path.splitext(model_name)[0]}-{time.time_ns()}"
+
+    paths = []
+    for i, output in enumerate(outputs):
+        path = os.path.join(raw_dir, f"{stem}-{i}.npy.gz")
+        with gzip.open(path, "wb") as f:
+            np.save(f, np.asarray(output))
+        paths.append(path)
+    return paths
+
+def load_raw_output(path):
+    with gzip.open(path, "rb") as f:
+        return np.load(f)
+
+# Append one row per output to every column under the store lock
+def append_digests(model_name, digests, store_dir=DIGEST_STORE, raw_paths=None):
+    os.makedirs(store_dir, exist_ok=True)
+    now = time.time()
+    rows = []
+    for i, digest in enumerate(digests):
+        row = dict(digest, timestamp=now, model=model_name, output_index=i)
+        row["raw_path"] = raw_paths[i] if raw_paths else ""
+        rows.append(row)
+
+    with file_lock(os.path.join(store_dir, ".lock")):
+        for column, dtype in COLUMNS.items():
+            with open(_column_path(store_dir, column), "ab") as f:
+                if dtype is str:
+                    f.write("".join(f"{str(r[column]).replace(chr(10), ' ')}\n" for r in rows).encode("utf-8"))
+                else:
+                    np.asarray([r[column] for r in rows], dtype=dtype).tofile(f)
+
+# Read the store back as {column: array/list}; rows from an interrupted append are dropped
+def read_digests(store_dir=DIGEST_STORE, columns=None):
+    columns = columns or list(COLUMNS)
+    data = {}
+    with file_lock(os.path.join(store_dir, ".lock")):
+        for column in columns:
+            path = _column_path(store_dir, column)
+            if not os.path.exists(path):
+                data[column] = [] if COLUMNS[column] is str else np.empty(0, dtype=COLUMNS[column])
+            elif COLUMNS[column] is str:
+                with open(path, "r", encoding="utf-8") as f:
+                    data[column] = f.read().splitlines()
+            else:
+                data[column] = np.fromfile(path, dtype=COLUMNS[column])
+
+    n_rows = min((len(v) for v in data.values()), default=0)
+    return {column: values[:n_rows] for column, values in data.items()}
+
+# Digest, optionally keep raw outputs, and append to the store; returns the digests
+def record_predictions(model_name, predictions, store_dir=DIGEST_STORE, save_raw=False):
+    digests = digest_predictions(predictions)
+    raw_paths = save_raw_outputs(model_name, predictions, store_dir) if save_raw else None
+    append_digests(model_name, digests, store_dir, raw_paths)
+    return digests
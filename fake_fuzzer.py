@@ -0,0 +1,58 @@
+import os
+import time
+import random
+import argparse
+
+# Local stand-in for LEMON/MUFFIN/CEDAR: re-emits sample .h5/.pkl pairs into a
+# watched folder at a fixed rate, writing each file in chunks like a real generator
+
+
+def _seed_pairs(seed_dirs):
+    pairs = []
+    for seed_dir in seed_dirs:
+        for file in sorted(os.listdir(seed_dir)):
+            if file.endswith(".h5"):
+                pkl_path = os.path.join(seed_dir, file.replace(".h5", ".pkl"))
+                pairs.append((os.path.join(seed_dir, file), pkl_path if os.path.exists(pkl_path) else None))
+    return pairs
+
+
+def _slow_copy(src, dst, chunk_size, chunk_delay):
+    with open(src, "rb") as fin, open(dst, "wb") as fout:
+        for chunk in iter(lambda: fin.read(chunk_size), b""):
+            fout.write(chunk)
+            fout.flush()
+            time.sleep(chunk_delay)
+
+
+def emit(seed_dirs, target_dir, count, rate, chunk_size=64 * 1024, chunk_delay=0.01,
+         drop_pkl_ratio=0.0, seed=0):
+    os.makedirs(target_dir, exist_ok=True)
+    pairs = _seed_pairs(seed_dirs)
+    if not pairs:
+        raise FileNotFoundError(f"No .h5 seeds found in {seed_dirs}")
+    rng = random.Random(seed)
+
+    for i in range(count):
+        h5_src, pkl_src = pairs[i % len(pairs)]
+        stem = f"{os.path.splitext(os.path.basename(h5_src))[0]}-fz{i:05d}"
+        _slow_copy(h5_src, os.path.join(target_dir, stem + ".h5"), chunk_size, chunk_delay)
+        # Emulate a "No Input Error" script by occasionally not producing its input
+        if pkl_src and rng.random() >= drop_pkl_ratio:
+            _slow_copy(pkl_src, os.path.join(target_dir, stem + ".pkl"), chunk_size, chunk_delay)
+        print(f"🧪 Emitted {stem}")
+        time.sleep(1.0 / rate)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Emit sample models into a folder watched by watch.py")
+    parser.add_argument("seed_dirs", nargs="*", default=["output_files"])
+    parser.add_argument("--target", default="input_files")
+    parser.add_argument("--count", type=int, default=20)
+    parser.add_argument("--rate", type=float, default=0.5, help="models per second")
+    parser.add_argument("--drop-pkl-ratio", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    emit(args.seed_dirs, args.target, args.count, args.rate,
+         drop_pkl_ratio=args.drop_pkl_ratio, seed=args.seed)
@@ -0,0 +1,133 @@
+import re
+import keras
+from keras.models import load_model
+from test import load_test_input
+
+# Locate the first layer that fails on the real input by bisecting over prefix
+# submodels, so repair prompts can carry a short fault summary instead of a full trace
+MAX_ERROR_CHARS = 300
+_ANSI = re.compile(r"\x1b\[[0-9;]*m")
+
+
+# First meaningful line of an exception message, without terminal colour codes
+def error_headline(error_msg, limit=MAX_ERROR_CHARS):
+    lines = [l.strip() for l in _ANSI.sub("", str(error_msg)).splitlines() if l.strip()]
+    lines = [l for l in lines if not l.startswith("Exception encountered when calling")] or lines
+    return lines[0][:limit] if lines else ""
+
+
+# Shape of a tensor/array, or the list of shapes for layers with several inputs (merges)
+def _shape(get):
+    try:
+        value = get()
+        if isinstance(value, (list, tuple)):
+            return str([tuple(v.shape) for v in value])
+        return str(tuple(value.shape))
+    except Exception:
+        return None
+
+
+# Submodel from the model inputs to the output of layer k, or None if it cannot be built
+def _prefix_model(model, k):
+    try:
+        return keras.Model(inputs=model.inputs, outputs=model.layers[k].output)
+    except Exception:
+        return None
+
+
+# Run the prefix ending at layer k; returns (exception or None, output)
+def _run_prefix(model, k, input_data):
+    prefix = _prefix_model(model, k)
+    if prefix is None:
+        return RuntimeError(f"cannot build a submodel ending at layer {k}"), None
+    try:
+        return None, prefix.predict(input_data, verbose=0)
+    except Exception as e:
+        return e, None
+
+
+# What layer k actually receives on the real input. For merges and skip connections this
+# is not the output of layer k - 1, so it is traced through the graph; None if it cannot be
+def _layer_input(model, k, input_data):
+    try:
+        feeder = keras.Model(inputs=model.inputs, outputs=model.layers[k].input)
+        return feeder.predict(input_data, verbose=0)
+    except Exception:
+        return input_data if k == 0 else None
+
+
+# Sequential fallback when prefix submodels cannot be built: call the layers one by one
+def _run_eagerly(model, input_data):
+    x = input_data
+    for k, layer in enumerate(model.layers):
+        try:
+            y = layer(x)
+        except Exception as e:
+            return k, e, x
+        x = y
+    return None, None, x
+
+
+def _summary(model, k, error, received):
+    layer = model.layers[k]
+    return {
+        "layer_index": k,
+        "num_layers": len(model.layers),
+        "layer_name": layer.name,
+        "layer_type": type(layer).__name__,
+        "expected_input_shape": _shape(lambda: layer.input),
+        "received_input_shape": _shape(lambda: received) if received is not None else None,
+        "output_shape": _shape(lambda: layer.output),
+        "error": error_headline(error),
+    }
+
+
+# Bisect over layer order for the first prefix that fails on `input_data`; None if nothing fails.
+# Bisection assumes that once a prefix fails every longer one does too. That holds for a chain,
+# but in a branching graph a prefix ending on a healthy branch can run while an earlier
+# prefix on another branch fails. The layer found there fails itself, yet it may not be the
+# earliest failing one.
+def localize_fault(model, input_data):
+    layers = model.layers
+    if not layers:
+        return None
+
+    # Prefixes of the whole graph only make sense if the full one can be built
+    if _prefix_model(model, len(layers) - 1) is not None:
+        if _run_prefix(model, len(layers) - 1, input_data)[0] is None:
+            return None
+        lo, hi = 0, len(layers) - 1
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if _run_prefix(model, mid, input_data)[0] is not None:
+                hi = mid
+            else:
+                lo = mid + 1
+        error, _ = _run_prefix(model, lo, input_data)
+        return _summary(model, lo, error, _layer_input(model, lo, input_data))
+
+    if isinstance(model, keras.Sequential):
+        k, error, received = _run_eagerly(model, input_data)
+        if k is not None:
+            return _summary(model, k, error, received)
+    return None
+
+
+# Load a failing model and its input, then localize; never raises
+def localize_model(h5_path, pkl_path):
+    try:
+        model = load_model(h5_path)
+        return localize_fault(model, load_test_input(pkl_path, model))
+    except Exception as e:
+        print(f"⚠️ Fault localization failed: {e}")
+        return None
+
+
+# Compact text for the repair prompt
+def format_fault(fault):
+    text = (f"The first failing layer is #{fault['layer_index']} of {fault['num_layers']}: "
+            f"'{fault['layer_name']}' ({fault['layer_type']}). "
+            f"It expects input shape {fault['expected_input_shape']} but receives {fault['received_input_shape']}")
+    if fault.get("output_shape"):
+        text += f", declared output shape {fault['output_shape']}"
+    return f"{text}.\nError: {fault['error']}"
@@ -1,26 +1,82 @@
 import os
 import json
-import openai
 import pickle
+import types
+import hashlib
 import numpy as np
-import importlib.util
 from keras.models import load_model
 from test import test_model
-
-# Extract simplified model summary for prompt, avoid overly long input
+from artifact_store import artifact_path, add_artifact, move_to_stage, work_path, ensure_registered
+from profiling import attach_verdict
+from llm_router import chat_completion, save_route, record_outcome, record_script_outcome
+
+# Generated inputs and their generator code, one folder per input signature
+INPUT_CACHE_DIR = "input_cache"
+
+# Normalized input signature: per-input shape without the batch dimension, dtype, and input count
+def extract_input_signature(model):
+    inputs = model.inputs
+    return {
+        "num_inputs": len(inputs),
+        "shapes": [[None if d is None else int(d) for d in tuple(t.shape)[1:]] for t in inputs],
+        "dtypes": [str(getattr(t.dtype, "name", t.dtype)) for t in inputs],
+    }
+
+def signature_key(signature):
+    return hashlib.sha1(json.dumps(signature, sort_keys=True).encode()).hexdigest()[:16]
+
+# Extract simplified model summary for prompt, avoid overly long input; also returns the input signature
 def extract_model_summary(model_path):
     try:
         model = load_model(model_path)
         input_shape = model.input_shape
         output_shape = model.output_shape
         num_layers = len(model.layers)
-        return f"Model input shape: {input_shape}, output shape: {output_shape}, number of layers: {num_layers}"
+        summary = f"Model input shape: {input_shape}, output shape: {output_shape}, number of layers: {num_layers}"
+        return summary, extract_input_signature(model)
     except Exception as e:
         print(f"❌ Failed to extract model structure: {e}")
+        return None, None
+
+def _cache_entry_dir(key):
+    return os.path.join(INPUT_CACHE_DIR, key)
+
+def _write_atomic(path, data):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+# Cached input for a signature, or None on a miss
+def lookup_input_cache(key):
+    input_path = os.path.join(_cache_entry_dir(key), "input.pkl")
+    if not os.path.exists(input_path):
         return None
+    with open(input_path, "rb") as f:
+        return pickle.load(f)
+
+def store_input_cache(key, signature, code, input_data):
+    entry_dir = _cache_entry_dir(key)
+    os.makedirs(entry_dir, exist_ok=True)
+    _write_atomic(os.path.join(entry_dir, "generator.py"), code.encode("utf-8"))
+    _write_atomic(os.path.join(entry_dir, "signature.json"), json.dumps(signature, indent=2).encode("utf-8"))
+    _write_atomic(os.path.join(entry_dir, "input.pkl"), pickle.dumps(input_data))
+
+# Once an input has passed a test it is kept; an untested input that fails is dropped
+def mark_input_verified(key):
+    open(os.path.join(_cache_entry_dir(key), "verified"), "w").close()
+
+def evict_input_cache(key):
+    entry_dir = _cache_entry_dir(key)
+    if os.path.exists(os.path.join(entry_dir, "verified")):
+        return
+    for name in ("input.pkl", "generator.py", "signature.json"):
+        path = os.path.join(entry_dir, name)
+        if os.path.exists(path):
+            os.remove(path)
 
-# Request input generation code from GPT
-def generate_input_with_gpt(api_key, model_summary):
+# Request input generation code from GPT; returns (code, model used)
+def generate_input_with_gpt(api_key, model_summary, attempt=0):
     prompt = f"""
 You are an expert in generating input for Keras models.
 
@@ -39,60 +95,99 @@ Model summary:
 {model_summary}
 """.strip()
 
-    openai.api_key = api_key
-    response = openai.ChatCompletion.create(
-        model="gpt-3.5-turbo",
+    raw_code, model = chat_completion(
+        api_key, "input", "No Input Error",
         messages=[
             {"role": "system", "content": "You are a Keras expert. The returned input generation function must contain code only."},
             {"role": "user", "content": prompt}
         ],
-        max_tokens=300
+        max_tokens=300,
+        attempt=attempt
     )
 
-    raw_code = response["choices"][0]["message"]["content"]
     code = raw_code.replace("```python", "").replace("```", "").strip()
-    return code
-
-# Execute code to generate numpy input
-def save_and_run_input_code(code, test_input_path="generated_input.py"):
-    with open(test_input_path, "w", encoding="utf-8") as f:
-        f.write(code)
+    return code, model
 
-    spec = importlib.util.spec_from_file_location("input_module", test_input_path)
-    module = importlib.util.module_from_spec(spec)
-    spec.loader.exec_module(module)
+# Execute code to generate numpy input, in a fresh module namespace so concurrent runs never share state
+def run_input_code(code, module_name="input_module"):
+    module = types.ModuleType(module_name)
+    exec(compile(code, f"<{module_name}>", "exec"), module.__dict__)
     return module.build_test_input()
 
-# Generate input for a single model
-def generate_input(h5_path, api_key):
+# Generate input for a single model; returns its signature key, or False on failure
+def generate_input(h5_path, api_key, pkl_path=None, attempt=0):
     try:
-        summary = extract_model_summary(h5_path)
+        summary, signature = extract_model_summary(h5_path)
         if not summary:
             return False
 
-        code = generate_input_with_gpt(api_key, summary)
-        input_data = save_and_run_input_code(code)
-
-        if isinstance(input_data, dict):
-            input_data = list(input_data.values())[0]
-
-        pkl_path = h5_path.replace(".h5", ".pkl")
+        # Models sharing an input signature reuse the same input without calling GPT
+        key = signature_key(signature)
+        input_data = lookup_input_cache(key)
+        if input_data is not None:
+            print(f"♻️ Reusing cached input for signature {key}")
+        else:
+            code, model = generate_input_with_gpt(api_key, summary, attempt)
+            try:
+                input_data = run_input_code(code, f"input_gen_{key}")
+            except Exception:
+                record_outcome("input", "No Input Error", model, False)
+                raise
+
+            if isinstance(input_data, dict):
+                input_data = list(input_data.values())[0]
+            store_input_cache(key, signature, code, input_data)
+            save_route(os.path.join(_cache_entry_dir(key), "generator.py"), "input", "No Input Error", model)
+            print(f"✅ GPT successfully generated input for signature {key}")
+
+        pkl_path = pkl_path or h5_path.replace(".h5", ".pkl")
         with open(pkl_path, "wb") as f:
             pickle.dump(input_data, f)
 
-        print(f"✅ GPT successfully generated input: {pkl_path}")
-        return True
+        print(f"✅ Input written: {pkl_path}")
+        return key
 
     except Exception as e:
         print(f"❌ Failed to generate input via GPT: {e}")
         return False
 
+# Generate and test an input for one model; returns the test result, or None if nothing was generated
+def process_no_input_model(api_key, model_file, gpt_input_dir="./gpt_input", output_dir="./output_files", attempt=0):
+    ensure_registered(model_file, "gpt_input", gpt_input_dir)
+    h5_path = artifact_path(model_file, "h5")
+    if not h5_path:
+        print(f"❌ {model_file} is not in the artifact store")
+        return None
+
+    print(f"\n🚧 Processing: {model_file}")
+    generated_path = work_path(model_file.replace(".h5", ".pkl"))
+    key = generate_input(h5_path, api_key, generated_path, attempt)
+    if not key:
+        return None
+    add_artifact(model_file, "pkl", generated_path, remove_source=True)
+    pkl_path = artifact_path(model_file, "pkl")
+
+    result = test_model(h5_path, pkl_path, model_name=model_file)
+    attach_verdict(model_file, result, None if result == "Success" else "No Input Error")
+    # Only a freshly generated input still carries its route; reused ones were credited already
+    record_script_outcome(os.path.join(_cache_entry_dir(key), "generator.py"), result == "Success", consume=True)
+    if result == "Success":
+        print("✅ Test passed → moving to output_files")
+        mark_input_verified(key)
+        move_to_stage(model_file, "output", output_dir)
+    else:
+        print("⚠️ Test failed → staying in gpt_input")
+        evict_input_cache(key)
+        move_to_stage(model_file, "gpt_input", gpt_input_dir)
+    return result
+
 # Batch process models with No Input Error
 def process_no_input_errors(
     api_key,
     error_info_path="error_info.json",
     gpt_input_dir="./gpt_input",
-    output_dir="./output_files"
+    output_dir="./output_files",
+    attempt=0
 ):
     if not os.path.exists(error_info_path):
         print(f"❌ Cannot find {error_info_path}")
@@ -109,19 +204,6 @@ def process_no_input_errors(
 
     for code, entry in error_data["No Input Error"].items():
         for model_file in entry["models"]:
-            h5_path = os.path.join(gpt_input_dir, model_file)
-            pkl_path = h5_path.replace(".h5", ".pkl")
-
-            print(f"\n🚧 Processing: {model_file}")
-            if not generate_input(h5_path, api_key):
-                continue
-
-            result = test_model(h5_path, pkl_path)
-            if result == "Success":
-                print("✅ Test passed → moving to output_files")
-                os.rename(h5_path, os.path.join(output_dir, model_file))
-                os.rename(pkl_path, os.path.join(output_dir, os.path.basename(pkl_path)))
-            else:
-                print("⚠️ Test failed → staying in gpt_input")
+            process_no_input_model(api_key, model_file, gpt_input_dir, output_dir, attempt)
 
     print("📌 No Input Error processing complete. Original JSON was not modified or deleted.")
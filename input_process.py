@@ -1,10 +1,13 @@
 import os
-import shutil
 import json
 import re
 from collections import defaultdict
 from keras.models import load_model
 from test import test_model
+from verdict_cache import cached_validation
+from artifact_store import register_model, artifact_path, move_to_stage, list_stage
+from profiling import profiled, attach_verdict
+from fault_localizer import localize_model
 
 #  Error classification function (updated version)
 def classify_error(error_msg):
@@ -32,52 +35,67 @@ def normalize_error_message(error_msg: str) -> str:
 #  Initialize error dictionary
 error_dict = defaultdict(lambda: defaultdict(set))
 
-def process_files(input_dir, output_dir, gpt_input_dir):
-    os.makedirs(output_dir, exist_ok=True)
-    os.makedirs(gpt_input_dir, exist_ok=True)
+# Load and test a single model; returns (result, error_type), error_type is None on success
+def validate_model(h5_path, pkl_path, file=None):
+    file = file or os.path.basename(h5_path)
 
-    for file in os.listdir(input_dir):
-        if file.endswith(".h5"):
-            h5_path = os.path.join(input_dir, file)
-            pkl_path = os.path.join(input_dir, file.replace(".h5", ".pkl"))
-
-            # Try to load the model
-            try:
-                model = load_model(h5_path)
-            except Exception as e:
-                raw_error = f"{type(e).__name__}: {str(e)}"
-                normalized_error = normalize_error_message(raw_error)
-                error_type = classify_error(normalized_error)
-                print(f"Model load failed, moving to gpt_input: {file}\nError type: {error_type}\nError message: {normalized_error}")
-                error_dict[error_type][normalized_error].add(file)
+    # Try to load the model
+    try:
+        with profiled("load_model", file):
+            load_model(h5_path)
+    except Exception as e:
+        raw_error = f"{type(e).__name__}: {str(e)}"
+        normalized_error = normalize_error_message(raw_error)
+        error_type = classify_error(normalized_error)
+        print(f"Model load failed, moving to gpt_input: {file}\nError type: {error_type}\nError message: {normalized_error}")
+        return raw_error, error_type, None
 
-                shutil.move(h5_path, os.path.join(gpt_input_dir, file))
-                if os.path.exists(pkl_path):
-                    shutil.move(pkl_path, os.path.join(gpt_input_dir, os.path.basename(pkl_path)))
-                continue
-
-            # Check if .pkl file is missing
-            if not os.path.exists(pkl_path):
-                print(f"{file} is missing .pkl → classified as No Input Error and moved to gpt_input")
-                error_dict["No Input Error"]["Missing .pkl input file"].add(file)
-                shutil.move(h5_path, os.path.join(gpt_input_dir, file))
-                continue
-
-            # Test the model normally
-            result = test_model(h5_path, pkl_path)
-            print(f"Processing {file} test result:\n{result}\n")
-
-            if result == "Success":
-                shutil.move(h5_path, os.path.join(output_dir, file))
-                shutil.move(pkl_path, os.path.join(output_dir, file.replace(".h5", ".pkl")))
-            else:
-                error_type = classify_error(result)
-                normalized_error = normalize_error_message(result)
-                error_dict[error_type][normalized_error].add(file)
-                shutil.move(h5_path, os.path.join(gpt_input_dir, file))
-                shutil.move(pkl_path, os.path.join(gpt_input_dir, file.replace(".h5", ".pkl")))
+    # Check if .pkl file is missing
+    if not pkl_path or not os.path.exists(pkl_path):
+        print(f"{file} is missing .pkl → classified as No Input Error and moved to gpt_input")
+        return "Missing .pkl input file", "No Input Error", None
 
-    # Save error information as JSON
+    # Test the model normally
+    result = test_model(h5_path, pkl_path, model_name=file)
+    print(f"Processing {file} test result:\n{result}\n")
+    if result == "Success":
+        return result, None, None
+
+    # Prediction errors get bisected down to the first failing layer
+    fault = localize_model(h5_path, pkl_path) if result.startswith("Error during prediction") else None
+    return result, classify_error(result), fault
+
+# Triage one dropped model: store it, validate it and record its stage.
+# Returns (result, error_type, normalized_error, fault); all but result are None on success
+#  `use_pkl=False` leaves a .pkl in input_dir alone, e.g. one whose write has not finished
+def triage_model(file, input_dir, output_dir="output_files", gpt_input_dir="gpt_input", use_pkl=True):
+    # Take the dropped pair into the artifact store, then work on the stored blobs
+    sources = [os.path.join(input_dir, file)]
+    if use_pkl:
+        sources.append(os.path.join(input_dir, file.replace(".h5", ".pkl")))
+    register_model(file, *sources)
+    h5_path = artifact_path(file, "h5")
+    pkl_path = artifact_path(file, "pkl")
+
+    # Reuse the verdict if this exact model/input pair was validated before
+    result, error_type, fault = cached_validation(h5_path, pkl_path, lambda: validate_model(h5_path, pkl_path, file))
+    attach_verdict(file, result, error_type)
+
+    move_to_stage(file, "output" if result == "Success" else "gpt_input",
+                  output_dir if result == "Success" else gpt_input_dir)
+    # The dropped files are consumed only once the model has a verdict and a stage, so a
+    # crash while loading or predicting leaves them in input_dir for the next run
+    for source in sources:
+        if os.path.exists(source):
+            os.remove(source)
+
+    if result == "Success":
+        return result, None, None, None
+    return result, error_type, normalize_error_message(result), fault
+
+#  Turn {error_type: {message: models}} into the error_info.json layout;
+#  `faults` maps model names to their localized fault summary
+def format_error_dict(error_dict, faults=None):
     formatted_error_dict = {}
 
     for etype, details in error_dict.items():
@@ -89,7 +107,29 @@ def process_files(input_dir, output_dir, gpt_input_dir):
                 "message": msg,
                 "models": list(models)
             }
+            group_faults = {m: faults[m] for m in models if faults and faults.get(m)}
+            if group_faults:
+                formatted_error_dict[etype][key]["faults"] = group_faults
             type_counter += 1
+    return formatted_error_dict
+
+def process_files(input_dir, output_dir, gpt_input_dir):
+    os.makedirs(output_dir, exist_ok=True)
+    os.makedirs(gpt_input_dir, exist_ok=True)
+
+    # Also retry models a crashed run registered but never gave a verdict
+    files = sorted({f for f in os.listdir(input_dir) if f.endswith(".h5")} | set(list_stage("input")))
+
+    faults = {}
+    for file in files:
+        if file.endswith(".h5"):
+            result, error_type, normalized_error, fault = triage_model(file, input_dir, output_dir, gpt_input_dir)
+            if result != "Success":
+                error_dict[error_type][normalized_error].add(file)
+                faults[file] = fault
+
+    # Save error information as JSON
+    formatted_error_dict = format_error_dict(error_dict, faults)
 
     with open("error_info.json", "w", encoding="utf-8") as f:
         json.dump(formatted_error_dict, f, indent=2, ensure_ascii=False)
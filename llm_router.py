@@ -0,0 +1,240 @@
+import os
+import sys
+import json
+import time
+from contextlib import contextmanager
+from file_lock import file_lock
+from llm_transport import create, MODE
+
+# Per-error-category model routing. Every call records its latency and token usage,
+# every validated repair or generated input records whether it worked; the next
+# request of the same kind goes to the cheapest, fastest model that meets the target
+# success rate, and a model only gets escalated when an earlier round failed.
+POLICY_PATH = os.environ.get("DELTA_LLM_POLICY", "llm_policy.json")
+# Offline runs keep their own statistics so replies from a cassette or stub never
+# skew the latency, cost and success rates that live routing relies on
+STATS_PATH = os.environ.get("DELTA_LLM_STATS",
+                            "llm_stats.json" if MODE in ("live", "record") else f"llm_stats.{MODE}.json")
+
+# Prices in USD per 1K tokens; the ladder runs from the cheapest to the strongest model.
+# Each task starts on the model it always used; add cheaper models to a ladder to let them compete
+DEFAULT_POLICY = {
+    "target_success_rate": 0.6,
+    "min_samples": 5,
+    "models": {
+        "gpt-3.5-turbo": {"input_price": 0.0005, "output_price": 0.0015},
+        "gpt-4-turbo": {"input_price": 0.01, "output_price": 0.03},
+    },
+    "tasks": {
+        "repair": {"ladder": ["gpt-4-turbo"]},
+        "input": {"ladder": ["gpt-3.5-turbo", "gpt-4-turbo"]},
+    },
+    # Per-category overrides, e.g. {"Shape Error": {"target_success_rate": 0.8, "ladder": ["gpt-4-turbo"]}}
+    "categories": {},
+}
+
+_policy = None
+
+
+# Overlay `override` on `base`, merging nested dicts key by key
+def _merge(base, override):
+    for key, value in override.items():
+        if isinstance(value, dict) and isinstance(base.get(key), dict):
+            _merge(base[key], value)
+        else:
+            base[key] = value
+    return base
+
+
+def load_policy(policy_path=POLICY_PATH):
+    global _policy
+    if _policy is not None and _policy["path"] == policy_path:
+        return _policy["policy"]
+    policy = json.loads(json.dumps(DEFAULT_POLICY))
+    if os.path.exists(policy_path):
+        with open(policy_path, "r", encoding="utf-8") as f:
+            _merge(policy, json.load(f))
+
+    # A ladder naming a model without prices would only fail once a request is routed to it
+    ladders = [(f"task {name}", settings.get("ladder")) for name, settings in policy["tasks"].items()]
+    ladders += [(f"category {name}", settings.get("ladder")) for name, settings in policy["categories"].items()]
+    for owner, ladder in ladders:
+        if ladder is None:
+            continue
+        if not ladder:
+            raise ValueError(f"{policy_path}: the ladder of {owner} is empty")
+        unknown = [model for model in ladder if model not in policy["models"]]
+        if unknown:
+            raise ValueError(f"{policy_path}: the ladder of {owner} names unknown models {unknown}; "
+                             f"known models are {sorted(policy['models'])}")
+    _policy = {"path": policy_path, "policy": policy}
+    return policy
+
+
+def _setting(policy, task, category, name):
+    override = policy["categories"].get(category, {})
+    if name in override:
+        return override[name]
+    if name in policy["tasks"].get(task, {}):
+        return policy["tasks"][task][name]
+    return policy[name]
+
+
+def _stats_key(task, category, model):
+    return f"{task}|{category}|{model}"
+
+
+def load_stats(stats_path=STATS_PATH):
+    if not os.path.exists(stats_path):
+        return {}
+    try:
+        with open(stats_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"⚠️ Failed to read LLM stats, starting empty: {e}")
+        return {}
+
+
+# Read-modify-write of the stats file under its lock, replaced atomically
+@contextmanager
+def _edit_stats(stats_path=STATS_PATH):
+    with file_lock(stats_path + ".lock"):
+        stats = load_stats(stats_path)
+        yield stats
+        tmp_path = f"{stats_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(stats, f, indent=2, ensure_ascii=False)
+        os.replace(tmp_path, stats_path)
+
+
+def _empty_row():
+    return {"calls": 0, "latency": 0.0, "prompt_tokens": 0, "completion_tokens": 0,
+            "attempts": 0, "successes": 0}
+
+
+def record_call(task, category, model, latency, prompt_tokens, completion_tokens, stats_path=STATS_PATH):
+    with _edit_stats(stats_path) as stats:
+        row = stats.setdefault(_stats_key(task, category, model), _empty_row())
+        row["calls"] += 1
+        row["latency"] += latency
+        row["prompt_tokens"] += prompt_tokens
+        row["completion_tokens"] += completion_tokens
+
+
+def record_outcome(task, category, model, success, stats_path=STATS_PATH):
+    with _edit_stats(stats_path) as stats:
+        row = stats.setdefault(_stats_key(task, category, model), _empty_row())
+        row["attempts"] += 1
+        row["successes"] += int(bool(success))
+
+
+# Success rate, mean latency and mean cost per call of one (task, category, model)
+def model_summary(row, prices):
+    calls = row["calls"] or 1
+    cost = (row["prompt_tokens"] * prices["input_price"] + row["completion_tokens"] * prices["output_price"]) / 1000
+    return {
+        "success_rate": row["successes"] / row["attempts"] if row["attempts"] else None,
+        "latency": row["latency"] / calls if row["calls"] else None,
+        "cost": cost / calls if row["calls"] else None,
+    }
+
+
+# Mean prompt and completion tokens per call of a task, over every category and model
+def mean_tokens(stats, task):
+    rows = [row for key, row in stats.items() if key.split("|")[0] == task and row["calls"]]
+    calls = sum(row["calls"] for row in rows)
+    if not calls:
+        return 1000, 1000  # nothing seen yet: compare prices per 1K tokens
+    return (sum(row["prompt_tokens"] for row in rows) / calls,
+            sum(row["completion_tokens"] for row in rows) / calls)
+
+
+# Pick the model for a request; `attempt` counts the earlier rounds that failed on it
+def route(task, category, attempt=0, policy_path=POLICY_PATH, stats_path=STATS_PATH):
+    policy = load_policy(policy_path)
+    ladder = _setting(policy, task, category, "ladder")
+    target = _setting(policy, task, category, "target_success_rate")
+    min_samples = _setting(policy, task, category, "min_samples")
+    stats = load_stats(stats_path)
+    prompt_tokens, completion_tokens = mean_tokens(stats, task)
+
+    candidates = []
+    for rank, model in enumerate(ladder):
+        prices = policy["models"][model]
+        row = stats.get(_stats_key(task, category, model), _empty_row())
+        summary = model_summary(row, prices)
+        # Models without enough history are given the benefit of the doubt, cheapest first
+        if row["attempts"] < min_samples or summary["success_rate"] >= target:
+            # Models never called are priced at the task's typical token counts, in the same unit
+            if summary["cost"] is not None:
+                cost = summary["cost"]
+            else:
+                cost = (prompt_tokens * prices["input_price"] + completion_tokens * prices["output_price"]) / 1000
+            candidates.append((cost, summary["latency"] or 0.0, rank))
+
+    if candidates:
+        base = min(candidates)[2]
+    else:
+        # Nothing meets the target: start from the model with the best record
+        rates = [model_summary(stats.get(_stats_key(task, category, m), _empty_row()), policy["models"][m])["success_rate"]
+                 for m in ladder]
+        base = max(range(len(ladder)), key=lambda i: (rates[i] or 0.0, i))
+    return ladder[min(base + attempt, len(ladder) - 1)]
+
+
+# Routed chat completion; returns (reply text, model used)
+def chat_completion(api_key, task, category, messages, max_tokens=300, attempt=0):
+    model = route(task, category, attempt)
+    start = time.time()
+    response = create(api_key, model, messages, max_tokens)
+    latency = time.time() - start
+
+    usage = response.get("usage") or {}
+    record_call(task, category, model, latency, usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0))
+    print(f"🧭 {task}/{category} → {model} ({latency:.2f}s)")
+    return response["choices"][0]["message"]["content"], model
+
+
+# Remember which model wrote a generated script, so its validation can be credited later
+def save_route(script_path, task, category, model):
+    with open(script_path + ".route.json", "w", encoding="utf-8") as f:
+        json.dump({"task": task, "category": category, "model": model}, f)
+
+
+# Credit a validation result to the model that wrote `script_path`; `consume` counts it only once
+def record_script_outcome(script_path, success, consume=False):
+    route_path = script_path + ".route.json"
+    if not os.path.exists(route_path):
+        return
+    with open(route_path, "r", encoding="utf-8") as f:
+        info = json.load(f)
+    if consume:
+        os.remove(route_path)
+    record_outcome(info["task"], info["category"], info["model"], success)
+
+
+def print_report(policy_path=POLICY_PATH, stats_path=STATS_PATH):
+    policy = load_policy(policy_path)
+    stats = load_stats(stats_path)
+    if not stats:
+        print("No LLM calls recorded yet")
+        return
+    print(f"{'task':<8} {'category':<18} {'model':<16} {'calls':>6} {'success':>8} {'latency':>8} {'cost':>9}")
+    for key in sorted(stats):
+        task, category, model = key.split("|")
+        row = stats[key]
+        summary = model_summary(row, policy["models"].get(model, {"input_price": 0, "output_price": 0}))
+        rate = f"{summary['success_rate']:.0%}" if summary["success_rate"] is not None else "-"
+        latency = f"{summary['latency']:.2f}s" if summary["latency"] is not None else "-"
+        cost = f"${summary['cost']:.4f}" if summary["cost"] is not None else "-"
+        print(f"{task:<8} {category:<18} {model:<16} {row['calls']:>6} {rate:>8} {latency:>8} {cost:>9}")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "init":
+        # Write the default policy as a starting point for editing
+        with open(POLICY_PATH, "w", encoding="utf-8") as f:
+            json.dump(DEFAULT_POLICY, f, indent=2)
+        print(f"📝 Default routing policy written to {POLICY_PATH}")
+    else:
+        print_report()
@@ -0,0 +1,154 @@
+import os
+import sys
+import json
+import time
+import random
+import hashlib
+from file_lock import file_lock
+
+# Transport under every LLM call, selected with DELTA_LLM_MODE:
+#   live       call OpenAI (default)
+#   record     call OpenAI and save each request/response pair in the cassette
+#   replay     serve pairs from the cassette, never touching the network
+#   synthetic  answer every request with a stub reply, for timing the pipeline alone
+# Replay and synthetic replies are delayed and failed on purpose so that scheduling
+# changes can be measured repeatably; DELTA_LLM_SEED makes the draws reproducible.
+MODE = os.environ.get("DELTA_LLM_MODE", "live")
+CASSETTE_DIR = os.environ.get("DELTA_LLM_CASSETTE", "llm_cassette")
+# Seconds per reply, or "recorded" to replay the latency measured when recording
+LATENCY = os.environ.get("DELTA_LLM_LATENCY", "recorded")
+JITTER = float(os.environ.get("DELTA_LLM_JITTER", "0"))
+ERROR_RATE = float(os.environ.get("DELTA_LLM_ERROR_RATE", "0"))
+SEED = os.environ.get("DELTA_LLM_SEED", "0")
+
+SYNTHETIC_LATENCY = 1.0
+SYNTHETIC_REPLY = "# synthetic reply, no code was generated"
+
+# Calls made so far per prompt key; the n-th repeat of a prompt records and replays the n-th reply
+# and draws fresh but reproducible delays
+_served = {}
+
+
+class SimulatedLLMError(RuntimeError):
+    """Injected replay/synthetic failure, standing in for a transient transport error."""
+
+
+# Hash of everything that shapes the reply except the model, so replays survive routing changes
+def prompt_key(messages, max_tokens):
+    payload = json.dumps({"messages": messages, "max_tokens": max_tokens}, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def cassette_path(key, cassette_dir=CASSETTE_DIR):
+    return os.path.join(cassette_dir, key[:2], key + ".json")
+
+
+# Replies recorded for a prompt, in the order they were made
+def _load_replies(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)["replies"]
+
+
+# Store the `occurrence`-th reply to a prompt, keeping the replies to its earlier repeats
+def _save_pair(key, occurrence, request, response, latency, cassette_dir=CASSETTE_DIR):
+    path = cassette_path(key, cassette_dir)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    pair = {"request": request, "response": response, "latency": round(latency, 4)}
+    with file_lock(path + ".lock"):
+        replies = _load_replies(path) if os.path.exists(path) else []
+        if occurrence < len(replies):
+            replies[occurrence] = pair
+        else:
+            replies.append(pair)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"replies": replies}, f, indent=2, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+
+# The `occurrence`-th recorded reply; repeats beyond the recording get the last one
+def _load_pair(key, occurrence, cassette_dir=CASSETTE_DIR):
+    path = cassette_path(key, cassette_dir)
+    if not os.path.exists(path):
+        raise LookupError(f"No recorded reply for prompt {key[:12]} in {cassette_dir}")
+    replies = _load_replies(path)
+    return replies[min(occurrence, len(replies) - 1)]
+
+
+def _live_call(api_key, model, messages, max_tokens):
+    import openai
+    openai.api_key = api_key
+    response = openai.ChatCompletion.create(model=model, messages=messages, max_tokens=max_tokens)
+    usage = response.get("usage") or {}
+    return {
+        "model": response.get("model", model),
+        "choices": [{"message": {"content": response["choices"][0]["message"]["content"]}}],
+        "usage": {"prompt_tokens": usage.get("prompt_tokens", 0),
+                  "completion_tokens": usage.get("completion_tokens", 0)},
+    }
+
+
+# Sleep for the simulated latency, then fail with probability ERROR_RATE
+def _simulate(key, occurrence, recorded_latency):
+    rng = random.Random(f"{SEED}:{key}:{occurrence}")
+
+    base = recorded_latency if LATENCY == "recorded" else float(LATENCY)
+    time.sleep(max(0.0, base + rng.uniform(-JITTER, JITTER)))
+    if rng.random() < ERROR_RATE:
+        raise SimulatedLLMError(f"Simulated LLM error for prompt {key[:12]}")
+
+
+def _synthetic_response(model, messages):
+    prompt_chars = sum(len(m["content"]) for m in messages)
+    return {
+        "model": model,
+        "choices": [{"message": {"content": SYNTHETIC_REPLY}}],
+        "usage": {"prompt_tokens": prompt_chars // 4, "completion_tokens": len(SYNTHETIC_REPLY) // 4},
+    }
+
+
+# Chat completion through the configured transport; returns an OpenAI-shaped dict
+def create(api_key, model, messages, max_tokens=300):
+    key = prompt_key(messages, max_tokens)
+    occurrence = _served.get(key, 0)
+    _served[key] = occurrence + 1
+
+    if MODE == "replay":
+        pair = _load_pair(key, occurrence)
+        _simulate(key, occurrence, pair["latency"])
+        return pair["response"]
+
+    if MODE == "synthetic":
+        _simulate(key, occurrence, SYNTHETIC_LATENCY)
+        return _synthetic_response(model, messages)
+
+    if MODE not in ("live", "record"):
+        raise ValueError(f"Unknown DELTA_LLM_MODE: {MODE}")
+
+    start = time.time()
+    response = _live_call(api_key, model, messages, max_tokens)
+    if MODE == "record":
+        request = {"model": model, "messages": messages, "max_tokens": max_tokens}
+        _save_pair(key, occurrence, request, response, time.time() - start)
+    return response
+
+
+def print_cassette(cassette_dir=CASSETTE_DIR):
+    if not os.path.isdir(cassette_dir):
+        print(f"No cassette at {cassette_dir}")
+        return
+    pairs = []
+    for sub in sorted(os.listdir(cassette_dir)):
+        for name in sorted(os.listdir(os.path.join(cassette_dir, sub))):
+            if name.endswith(".json"):
+                pairs.extend(_load_replies(os.path.join(cassette_dir, sub, name)))
+    latencies = [p["latency"] for p in pairs]
+    print(f"📼 {len(pairs)} recorded replies in {cassette_dir}")
+    if latencies:
+        print(f"⏱ latency mean {sum(latencies) / len(latencies):.2f}s, max {max(latencies):.2f}s")
+    for model in sorted({p["request"]["model"] for p in pairs}):
+        print(f"   {model}: {sum(p['request']['model'] == model for p in pairs)}")
+
+
+if __name__ == "__main__":
+    print_cassette(*sys.argv[1:2])
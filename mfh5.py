@@ -5,13 +5,13 @@ import tensorflow as tf
 from tensorflow.keras import layers, Model
 from tensorflow.keras.layers import Input
 from layer_map import LAYER_NAME_MAP
+from profiling import profiled, attach_verdict
+from weight_pack import ensure_pack, open_pack, layer_weights
 
 # Root directories
 source_root = "./muffin_files"
 output_root = "./input_files"
 
-os.makedirs(output_root, exist_ok=True)
-
 def build_model(model_json_path):
     with open(model_json_path, "r") as f:
         j = json.load(f)
@@ -81,42 +81,81 @@ def build_model(model_json_path):
 
     return Model(inputs=input_tensors, outputs=output_tensors), graph
 
-# Traverse each model directory
-for model_name in os.listdir(source_root):
+def _layer_names(graph):
+    for idx in graph:
+        args = graph[idx].get("args", {})
+        yield args.get("name", f"{idx.zfill(2)}_{graph[idx]['type']}")
+
+def _load_layer_npz(model, lname, weight_file):
+    data = np.load(weight_file, allow_pickle=True)
+    if data.files:  # Empty file counts as success
+        weights = [data[k] for k in sorted(data.files)]
+        model.get_layer(name=lname).set_weights(weights)
+
+# Original path: one .npz archive per layer
+def load_weights_npz(model, graph, weight_dir):
+    success, failed = 0, 0
+    for lname in _layer_names(graph):
+        weight_file = os.path.join(weight_dir, f"{lname}.npz")
+        if not os.path.exists(weight_file):
+            continue
+        try:
+            _load_layer_npz(model, lname, weight_file)
+            success += 1
+        except Exception as e:
+            print(f"⚠ Failed to load weights: {lname}, error: {e}")
+            failed += 1
+    return success, failed
+
+# Packed path: one memory-mapped file, weights assigned from views without parsing archives
+def load_weights_pack(model, graph, weight_dir):
+    mm, index = open_pack(ensure_pack(weight_dir))
+    fallback = set(index["fallback"])
+    success, failed = 0, 0
+    for lname in _layer_names(graph):
+        try:
+            if lname in fallback:
+                _load_layer_npz(model, lname, os.path.join(weight_dir, f"{lname}.npz"))
+            elif lname not in index["layers"]:
+                continue
+            elif index["layers"][lname]:  # Empty file counts as success
+                model.get_layer(name=lname).set_weights(layer_weights(mm, index["layers"][lname]))
+            success += 1
+        except Exception as e:
+            print(f"⚠ Failed to load weights: {lname}, error: {e}")
+            failed += 1
+    return success, failed
+
+def convert_model(model_name, use_pack=True):
     model_dir = os.path.join(source_root, model_name)
     json_path = os.path.join(model_dir, "model.json")
     weight_dir = os.path.join(model_dir, "initial_weights")
 
     if not os.path.exists(json_path) or not os.path.exists(weight_dir):
         print(f"❌ Skipping: {model_name}, missing required files")
-        continue
+        return
 
     try:
-        model, graph = build_model(json_path)
-        success, failed = 0, 0
-
-        for idx in graph:
-            args = graph[idx].get("args", {})
-            lname = args.get("name", f"{idx.zfill(2)}_{graph[idx]['type']}")
-            weight_file = os.path.join(weight_dir, f"{lname}.npz")
-            if not os.path.exists(weight_file):
-                continue
-            try:
-                data = np.load(weight_file, allow_pickle=True)
-                if not data.files:
-                    success += 1  # Empty file counts as success
-                    continue
-                weights = [data[k] for k in sorted(data.files)]
-                layer = model.get_layer(name=lname)
-                layer.set_weights(weights)
-                success += 1
-            except Exception as e:
-                print(f"⚠ Failed to load weights: {lname}, error: {e}")
-                failed += 1
+        with profiled("build_model", model_name):
+            model, graph = build_model(json_path)
+
+        load_weights = load_weights_pack if use_pack else load_weights_npz
+        success, failed = load_weights(model, graph, weight_dir)
 
         save_path = os.path.join(output_root, f"{model_name}.h5")
         model.save(save_path)
         print(f"✔ Model converted successfully: {model_name}, weights loaded: {success}, failed: {failed}")
+        attach_verdict(model_name, "Success", None)
+        return success, failed
 
     except Exception as e:
         print(f"❌ Conversion failed: {model_name}, error: {e}")
+        attach_verdict(model_name, f"Conversion failed: {e}", "Conversion Error")
+
+if __name__ == "__main__":
+    os.makedirs(output_root, exist_ok=True)
+    use_pack = os.environ.get("DELTA_WEIGHT_PACK", "1") != "0"
+
+    # Traverse each model directory
+    for model_name in os.listdir(source_root):
+        convert_model(model_name, use_pack)
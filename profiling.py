@@ -0,0 +1,154 @@
+import os
+import sys
+import json
+import time
+import threading
+import tracemalloc
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+
+# Threshold-triggered profiling of slow or memory-hungry calls. Nothing is recorded
+# until a call runs longer than DELTA_PROFILE_LATENCY seconds or grows RSS by more than
+# DELTA_PROFILE_MEMORY MB; from then on a watchdog thread samples the caller's stack.
+PROFILE_DIR = os.environ.get("DELTA_PROFILE_DIR", "profiles")
+LATENCY_THRESHOLD = float(os.environ["DELTA_PROFILE_LATENCY"]) if os.environ.get("DELTA_PROFILE_LATENCY") else None
+MEMORY_THRESHOLD_MB = float(os.environ["DELTA_PROFILE_MEMORY"]) if os.environ.get("DELTA_PROFILE_MEMORY") else None
+TF_TRACE = os.environ.get("DELTA_PROFILE_TF") == "1"
+ALLOC_SNAPSHOT = os.environ.get("DELTA_PROFILE_ALLOC") == "1"
+ENABLED = LATENCY_THRESHOLD is not None or MEMORY_THRESHOLD_MB is not None
+
+WATCH_INTERVAL = 0.05
+SAMPLE_INTERVAL = 0.005
+
+# Capture folders per model, waiting for the model's verdict
+_pending = defaultdict(list)
+
+
+def _rss_mb():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except (OSError, ValueError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _collapse(frame):
+    stack = []
+    while frame is not None:
+        code = frame.f_code
+        stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}")
+        frame = frame.f_back
+    return ";".join(reversed(stack))
+
+
+def _trigger(state, reason, capture_dir):
+    state["reason"] = reason
+    os.makedirs(capture_dir, exist_ok=True)
+    if ALLOC_SNAPSHOT and not tracemalloc.is_tracing():
+        tracemalloc.start(25)
+        state["tracemalloc"] = True
+    if TF_TRACE:
+        try:
+            import tensorflow as tf
+            tf.profiler.experimental.start(os.path.join(capture_dir, "tf_trace"))
+            state["tf_trace"] = True
+        except Exception as e:
+            print(f"⚠️ TF profiler unavailable: {e}")
+
+
+def _watchdog(target, state, stop, start, rss_start, capture_dir):
+    while not stop.wait(SAMPLE_INTERVAL if state["reason"] else WATCH_INTERVAL):
+        if not state["reason"]:
+            rss_delta = _rss_mb() - rss_start
+            if LATENCY_THRESHOLD is not None and time.perf_counter() - start >= LATENCY_THRESHOLD:
+                _trigger(state, f"latency > {LATENCY_THRESHOLD}s", capture_dir)
+            elif MEMORY_THRESHOLD_MB is not None and rss_delta >= MEMORY_THRESHOLD_MB:
+                _trigger(state, f"rss +{rss_delta:.0f}MB > {MEMORY_THRESHOLD_MB}MB", capture_dir)
+            continue
+        frame = sys._current_frames().get(target)
+        if frame is not None:
+            state["samples"][_collapse(frame)] += 1
+
+
+def _write_report(capture_dir, label, model_name, state, elapsed, rss_delta):
+    samples = state["samples"]
+    with open(os.path.join(capture_dir, "stacks.txt"), "w", encoding="utf-8") as f:
+        for stack, count in samples.most_common():
+            f.write(f"{stack} {count}\n")
+
+    # Self and inclusive sample counts per function, like a pstats summary
+    own, inclusive = Counter(), Counter()
+    for stack, count in samples.items():
+        frames = stack.split(";")
+        own[frames[-1].rsplit(":", 1)[0]] += count
+        for fn in {fr.rsplit(":", 1)[0] for fr in frames}:
+            inclusive[fn] += count
+    total = sum(samples.values()) or 1
+    with open(os.path.join(capture_dir, "profile.txt"), "w", encoding="utf-8") as f:
+        f.write(f"{label} for {model_name}: {elapsed:.2f}s, {sum(samples.values())} samples every {SAMPLE_INTERVAL}s\n\n")
+        f.write(f"{'self%':>7} {'incl%':>7}  function\n")
+        for fn, count in inclusive.most_common(40):
+            f.write(f"{100 * own[fn] / total:7.1f} {100 * count / total:7.1f}  {fn}\n")
+
+    if state["tracemalloc"]:
+        snapshot = tracemalloc.take_snapshot()
+        tracemalloc.stop()
+        with open(os.path.join(capture_dir, "alloc.txt"), "w", encoding="utf-8") as f:
+            for stat in snapshot.statistics("lineno")[:30]:
+                f.write(f"{stat}\n")
+
+    meta = {
+        "label": label,
+        "model": model_name,
+        "trigger": state["reason"],
+        "elapsed": round(elapsed, 4),
+        "rss_delta_mb": round(rss_delta, 1),
+        "result": None,
+        "error_type": None,
+    }
+    with open(os.path.join(capture_dir, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f, indent=2, ensure_ascii=False)
+
+
+# Wrap a hot call; costs one idle watchdog thread unless a threshold is crossed
+@contextmanager
+def profiled(label, model_name=None):
+    if not ENABLED:
+        yield
+        return
+
+    model_name = model_name or "unknown"
+    capture_dir = os.path.join(PROFILE_DIR, os.path.splitext(model_name)[0], f"{label}-{time.time_ns()}")
+    state = {"reason": None, "samples": Counter(), "tracemalloc": False, "tf_trace": False}
+    stop = threading.Event()
+    start = time.perf_counter()
+    rss_start = _rss_mb()
+    watchdog = threading.Thread(target=_watchdog,
+                                args=(threading.get_ident(), state, stop, start, rss_start, capture_dir),
+                                daemon=True)
+    watchdog.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        watchdog.join()
+        if state["reason"]:
+            if state["tf_trace"]:
+                import tensorflow as tf
+                tf.profiler.experimental.stop()
+            _write_report(capture_dir, label, model_name, state, time.perf_counter() - start, _rss_mb() - rss_start)
+            _pending[model_name].append(capture_dir)
+            print(f"🔬 Profiled slow {label} of {model_name} ({state['reason']}): {capture_dir}")
+
+
+# Record the model's verdict and error category next to its captures
+def attach_verdict(model_name, result, error_type):
+    for capture_dir in _pending.pop(model_name or "unknown", []):
+        meta_path = os.path.join(capture_dir, "meta.json")
+        with open(meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        meta["result"] = result
+        meta["error_type"] = error_type
+        with open(meta_path, "w", encoding="utf-8") as f:
+            json.dump(meta, f, indent=2, ensure_ascii=False)
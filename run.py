@@ -1,13 +1,8 @@
 # run.py
 
 import time
-import os
 from code_process import run_full_pipeline
-
-def count_h5_files(directory):
-    if not os.path.exists(directory):
-        return 0
-    return len([f for f in os.listdir(directory) if f.endswith(".h5")])
+from artifact_store import count_stage
 
 if __name__ == "__main__":
     start_time = time.time()
@@ -18,17 +13,20 @@ if __name__ == "__main__":
     end_time = time.time()
     duration = end_time - start_time
 
-    # Count .h5 files in each directory
-    failure_count = count_h5_files("failure_files")
-    gpt_input_count = count_h5_files("gpt_input")
-    output_count = count_h5_files("output_files")
+    # Count models in each stage from the artifact index
+    input_count = count_stage("input")
+    failure_count = count_stage("failure")
+    gpt_input_count = count_stage("gpt_input")
+    output_count = count_stage("output")
 
-    total_failed = failure_count + gpt_input_count
+    total_failed = failure_count + gpt_input_count + input_count
     total = total_failed + output_count
     success_ratio = (output_count / total) * 100 if total > 0 else 0
 
     print("\n✅ All processing completed")
     print(f"⏱ Total time: {duration:.2f} seconds")
     print(f"📊 Number of failed repairs: {total_failed}")
+    if input_count:
+        print(f"⚠️ Models without a verdict (still at stage input): {input_count}")
     print(f"📈 Number of successful repairs: {output_count}")
     print(f"🎯 Success rate: {success_ratio:.2f}%")
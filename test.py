@@ -2,44 +2,61 @@ import pickle
 import numpy as np
 from keras.models import load_model
 import os
-
-def test_model(model_path, pkl_path):
+from digest_store import DIGEST_STORE, SAVE_RAW, record_predictions, format_digest
+from profiling import profiled
+
+# Load the .pkl input of a model and preprocess it the way prediction expects
+def load_test_input(pkl_path, model):
+    if pkl_path and os.path.exists(pkl_path):
+        with open(pkl_path, 'rb') as f:
+            input_data = pickle.load(f)
+
+        # ✅ Fix for dict-type input
+        if isinstance(input_data, dict):
+            print("⚠️ Input is a dict, extracting the first value")
+            input_data = list(input_data.values())[0]
+    else:
+        # If no .pkl file, generate random input from model input_shape
+        input_shape = model.input_shape[1:]
+        input_data = np.random.random(input_shape)
+
+    # ✅ Ensure input is a NumPy array (avoid list or other types)
+    if not isinstance(input_data, np.ndarray):
+        input_data = np.array(input_data)
+
+    # ✅ Convert dtype and normalize
+    if hasattr(input_data, "astype"):
+        input_data = input_data.astype('float32') / 255.0
+
+    # ✅ Optionally add batch dimension (disabled here)
+    # input_data = np.expand_dims(input_data, axis=0)
+    return input_data
+
+def test_model(model_path, pkl_path, digest_store=DIGEST_STORE, save_raw=None, model_name=None):
+    save_raw = SAVE_RAW if save_raw is None else save_raw
     try:
-        model = load_model(model_path)
-
-        if os.path.exists(pkl_path):
-            with open(pkl_path, 'rb') as f:
-                input_data = pickle.load(f)
-
-            # ✅ Fix for dict-type input
-            if isinstance(input_data, dict):
-                print("⚠️ Input is a dict, extracting the first value")
-                input_data = list(input_data.values())[0]
-        else:
-            # If no .pkl file, generate random input from model input_shape
-            input_shape = model.input_shape[1:]
-            input_data = np.random.random(input_shape)
-
-        # ✅ Ensure input is a NumPy array (avoid list or other types)
-        if not isinstance(input_data, np.ndarray):
-            input_data = np.array(input_data)
+        with profiled("load_model", model_name):
+            model = load_model(model_path)
 
-        # ✅ Convert dtype and normalize
-        if hasattr(input_data, "astype"):
-            input_data = input_data.astype('float32') / 255.0
-
-        # ✅ Optionally add batch dimension (disabled here)
-        # input_data = np.expand_dims(input_data, axis=0)
+        input_data = load_test_input(pkl_path, model)
 
         try:
-            predictions = model.predict(input_data)
-            print(f"Predictions: {predictions}")
-            return "Success"
+            with profiled("predict", model_name):
+                predictions = model.predict(input_data)
         except Exception as e:
             error_msg = f"Error during prediction: {e}"
             print(error_msg)
             return error_msg
 
+        # ✅ Keep a compact digest of the outputs instead of printing the full array
+        try:
+            digests = record_predictions(model_name or os.path.basename(model_path), predictions, digest_store, save_raw)
+            for i, digest in enumerate(digests):
+                print(f"Predictions[{i}]: {format_digest(digest)}")
+        except Exception as e:
+            print(f"⚠️ Failed to record prediction digest: {e}")
+        return "Success"
+
     except Exception as e:
         error_msg = f"Error: {e}"
         print(error_msg)
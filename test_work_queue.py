@@ -0,0 +1,73 @@
+import multiprocessing as mp
+import work_queue
+
+# Lease expiry and requeue across processes, as when a worker host dies mid-task.
+# Leases are long enough never to lapse on their own; the tests expire them explicitly
+LEASE = 30
+
+
+def _lease_and_die(db_path, worker_id, out):
+    conn = work_queue.connect(db_path)
+    task = work_queue.lease(conn, worker_id, LEASE)
+    out.put(task[0] if task else None)
+    conn.close()  # exit without completing or heartbeating
+
+
+def _lease_and_complete(db_path, worker_id, out):
+    conn = work_queue.connect(db_path)
+    task = work_queue.lease(conn, worker_id, LEASE)
+    out.put((task[0], work_queue.complete(conn, task[0], worker_id, {"ok": True})) if task else None)
+    conn.close()
+
+
+def _run(target, *args):
+    ctx = mp.get_context("spawn")
+    out = ctx.Queue()
+    p = ctx.Process(target=target, args=args + (out,))
+    p.start()
+    result = out.get(timeout=60)
+    p.join(60)
+    return result
+
+
+def _expire_leases(conn):
+    conn.execute("UPDATE tasks SET lease_expires = 0 WHERE status = 'leased'")
+
+
+def _status(db_path, task_id):
+    conn = work_queue.connect(db_path)
+    row = conn.execute("SELECT status, attempts, worker FROM tasks WHERE id = ?", (task_id,)).fetchone()
+    conn.close()
+    return row
+
+
+def test_expired_lease_is_requeued_to_another_worker(tmp_path):
+    db_path = str(tmp_path / "queue.db")
+    conn = work_queue.connect(db_path)
+    work_queue.enqueue(conn, "triage", [("triage", {"file": "m.h5"})])
+
+    task_id = _run(_lease_and_die, db_path, "dead")
+    assert work_queue.lease(conn, "other", LEASE) is None  # still leased by the dead worker
+
+    _expire_leases(conn)
+    assert _run(_lease_and_complete, db_path, "alive") == (task_id, True)
+    assert _status(db_path, task_id) == ("done", 2, "alive")
+
+    # The worker that lost its lease cannot overwrite the result
+    assert not work_queue.complete(conn, task_id, "dead", {"ok": False})
+    conn.close()
+
+
+def test_task_fails_after_max_attempts(tmp_path):
+    db_path = str(tmp_path / "queue.db")
+    conn = work_queue.connect(db_path)
+    work_queue.enqueue(conn, "triage", [("triage", {"file": "m.h5"})])
+
+    for i in range(work_queue.MAX_ATTEMPTS):
+        assert _run(_lease_and_die, db_path, f"dead-{i}") is not None
+        _expire_leases(conn)
+
+    assert work_queue.lease(conn, "last", LEASE) is None
+    status, attempts, _ = conn.execute("SELECT status, attempts, worker FROM tasks").fetchone()
+    assert (status, attempts) == ("failed", work_queue.MAX_ATTEMPTS)
+    conn.close()
@@ -0,0 +1,136 @@
+import os
+import json
+import time
+import hashlib
+from importlib import metadata
+from file_lock import file_lock
+
+# Persistent cache of validation verdicts, keyed by the content of the
+# .h5/.pkl pair and by the versions of the libraries that produced the verdict
+CACHE_PATH = "verdict_cache.json"
+TRACKED_PACKAGES = ("tensorflow", "keras", "numpy")
+
+_cache = None
+
+
+# Content hash of a file, read in chunks so large models do not sit in memory
+def file_digest(path, chunk_size=1 << 20):
+    if not path or not os.path.exists(path):
+        return None
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+# Versions of the runtime libraries; a change here invalidates every verdict
+def runtime_versions():
+    versions = {}
+    for pkg in TRACKED_PACKAGES:
+        try:
+            versions[pkg] = metadata.version(pkg)
+        except metadata.PackageNotFoundError:
+            versions[pkg] = None
+    return versions
+
+
+def cache_key(h5_path, pkl_path):
+    h5_digest = file_digest(h5_path)
+    if h5_digest is None:
+        return None
+    pkl_digest = file_digest(pkl_path) or "missing"
+    return f"{h5_digest}:{pkl_digest}"
+
+
+# Key of a repair script applied to an input; repaired models get fresh initial weights on
+# every build, so their .h5 content cannot identify them across runs
+def repair_key(script_path, pkl_path):
+    script_digest = file_digest(script_path)
+    if script_digest is None:
+        return None
+    pkl_digest = file_digest(pkl_path) or "missing"
+    return f"repair:{script_digest}:{pkl_digest}"
+
+
+def _load_cache(cache_path=CACHE_PATH):
+    global _cache
+    if _cache is not None and _cache["path"] == cache_path:
+        return _cache
+
+    versions = runtime_versions()
+    entries = {}
+    if os.path.exists(cache_path):
+        try:
+            with open(cache_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("versions") == versions:
+                entries = data.get("entries", {})
+            else:
+                print("♻️ Library versions changed, discarding cached verdicts")
+        except (OSError, ValueError) as e:
+            print(f"⚠️ Failed to read verdict cache, starting empty: {e}")
+
+    _cache = {"path": cache_path, "versions": versions, "entries": entries}
+    return _cache
+
+
+# Merge with what other processes wrote in the meantime, then replace the file atomically
+def _save_cache(cache):
+    with file_lock(cache["path"] + ".lock"):
+        if os.path.exists(cache["path"]):
+            try:
+                with open(cache["path"], "r", encoding="utf-8") as f:
+                    data = json.load(f)
+                if data.get("versions") == cache["versions"]:
+                    cache["entries"] = {**data.get("entries", {}), **cache["entries"]}
+            except (OSError, ValueError):
+                pass
+        tmp_path = f"{cache['path']}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"versions": cache["versions"], "entries": cache["entries"]}, f, indent=2, ensure_ascii=False)
+        os.replace(tmp_path, cache["path"])
+
+
+def get_entry(key, cache_path=CACHE_PATH):
+    if key is None:
+        return None
+    return _load_cache(cache_path)["entries"].get(key)
+
+
+def put_entry(key, entry, cache_path=CACHE_PATH):
+    if key is None:
+        return
+    cache = _load_cache(cache_path)
+    cache["entries"][key] = entry
+    _save_cache(cache)
+
+
+# Return the cached verdict for a model/input pair, or None on a miss
+def get_verdict(h5_path, pkl_path, cache_path=CACHE_PATH):
+    return get_entry(cache_key(h5_path, pkl_path), cache_path)
+
+
+def put_verdict(h5_path, pkl_path, result, error_type, duration, fault=None, cache_path=CACHE_PATH):
+    put_entry(cache_key(h5_path, pkl_path), {
+        "result": result,
+        "error_type": error_type,
+        "duration": round(duration, 4),
+        "model": os.path.basename(h5_path),
+        "fault": fault,
+    }, cache_path)
+
+
+# Run `validate` only when no verdict for this exact pair is cached.
+# `validate` returns (result, error_type, fault), error_type being None on success
+# and fault the localized failing layer, if any.
+def cached_validation(h5_path, pkl_path, validate, cache_path=CACHE_PATH):
+    cached = get_verdict(h5_path, pkl_path, cache_path)
+    if cached is not None:
+        print(f"💾 Cached verdict for {os.path.basename(h5_path)} ({cached['duration']:.2f}s saved)")
+        return cached["result"], cached["error_type"], cached.get("fault")
+
+    start = time.time()
+    result, error_type, fault = validate()
+    put_verdict(h5_path, pkl_path, result, error_type, time.time() - start, fault, cache_path)
+    return result, error_type, fault
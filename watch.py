@@ -0,0 +1,226 @@
+import os
+import json
+import time
+import select
+import struct
+import ctypes
+import ctypes.util
+import argparse
+from collections import defaultdict
+from input_process import triage_model, format_error_dict
+from artifact_store import get_stage
+from code_process import run_repair_rounds
+
+# Daemon mode: repair models as the fuzzer drops them into the input folder
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+_EVENT_HEADER = struct.Struct("iIII")
+
+WATCH_DIR = "watch"
+VERDICT_PATH = "watch_verdicts.jsonl"
+
+
+def _is_model_file(name):
+    return name.endswith(".h5") or name.endswith(".pkl")
+
+
+# Returns an inotify fd watching for finished writes, or None when unavailable
+def _inotify_open(input_dir):
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        fd = libc.inotify_init1(os.O_NONBLOCK)
+        if fd < 0:
+            return None
+        if libc.inotify_add_watch(fd, os.fsencode(input_dir), IN_CLOSE_WRITE | IN_MOVED_TO) < 0:
+            os.close(fd)
+            return None
+        return fd
+    except (OSError, AttributeError):
+        return None
+
+
+# Size and mtime of every model file in input_dir
+def _snapshot(input_dir):
+    current = {}
+    for name in os.listdir(input_dir):
+        if not _is_model_file(name):
+            continue
+        try:
+            st = os.stat(os.path.join(input_dir, name))
+        except FileNotFoundError:
+            continue
+        current[name] = (st.st_size, st.st_mtime_ns)
+    return current
+
+
+# Yields, once per tick, the files whose writer has closed them (or which were moved in)
+def inotify_completed(fd, input_dir, interval):
+    # Files already present count only if they stay unchanged for a tick; one still being
+    # written is reported by its close event instead
+    before = _snapshot(input_dir)
+    time.sleep(interval)
+    yield sorted(n for n, sig in _snapshot(input_dir).items() if before.get(n) == sig)
+    while True:
+        names = []
+        ready, _, _ = select.select([fd], [], [], interval)
+        if ready:
+            data = os.read(fd, 64 * 1024)
+            offset = 0
+            while offset < len(data):
+                _, _, _, length = _EVENT_HEADER.unpack_from(data, offset)
+                offset += _EVENT_HEADER.size
+                name = data[offset:offset + length].rstrip(b"\0").decode()
+                offset += length
+                if _is_model_file(name):
+                    names.append(name)
+        yield names
+
+
+# Polling fallback: a file is complete once its size and mtime stop changing between two polls
+def polling_completed(input_dir, interval):
+    previous = {}
+    reported = set()
+    while True:
+        current = _snapshot(input_dir)
+        completed = [n for n, sig in current.items() if previous.get(n) == sig and n not in reported]
+        reported = (reported | set(completed)) & set(current)
+        previous = current
+        yield completed
+        time.sleep(interval)
+
+
+# Run both repair rounds for a single model, keeping its bookkeeping in its own folder
+def repair_model(api_key, file, error_type, normalized_error, fault=None):
+    work_dir = os.path.join(WATCH_DIR, os.path.splitext(file)[0])
+    os.makedirs(work_dir, exist_ok=True)
+    error_info_path = os.path.join(work_dir, "error_info.json")
+    error_dict = defaultdict(lambda: defaultdict(set))
+    error_dict[error_type][normalized_error].add(file)
+    with open(error_info_path, "w", encoding="utf-8") as f:
+        json.dump(format_error_dict(error_dict, {file: fault}), f, indent=2, ensure_ascii=False)
+
+    run_repair_rounds(api_key, error_info_path,
+                      fail_info_path=os.path.join(work_dir, "fail_error_info.json"),
+                      failure_info_path=os.path.join(work_dir, "failure_info.json"),
+                      repair_dirs=(os.path.join(work_dir, "repairs"), os.path.join(work_dir, "repairs2")))
+
+
+def _percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def print_stats(latencies, started):
+    if not latencies:
+        return
+    elapsed = time.time() - started
+    print(f"⏱ {len(latencies)} models in {elapsed:.1f}s | throughput {len(latencies) / elapsed * 60:.2f} models/min | "
+          f"latency mean {sum(latencies) / len(latencies):.2f}s p50 {_percentile(latencies, 0.5):.2f}s "
+          f"p95 {_percentile(latencies, 0.95):.2f}s")
+
+
+def watch(input_dir="input_files", api_key=None, interval=1.0, pair_timeout=30.0,
+          use_inotify=True, max_models=None, verdict_path=VERDICT_PATH):
+    os.makedirs(input_dir, exist_ok=True)
+    fd = _inotify_open(input_dir) if use_inotify else None
+    if fd is not None:
+        print(f"👀 Watching {input_dir} with inotify")
+        events = inotify_completed(fd, input_dir, interval)
+    else:
+        print(f"👀 Watching {input_dir} by polling every {interval}s")
+        events = polling_completed(input_dir, interval)
+
+    started = time.time()
+    complete = {}  # file name -> time its write finished (mtime)
+    latencies = []
+
+    try:
+        for completed in events:
+            now = time.time()
+            for name in completed:
+                # The write finished at the file's mtime, not when this loop got to the event;
+                # events queued behind a long repair keep their waiting time in the latency
+                try:
+                    complete.setdefault(name, min(now, os.stat(os.path.join(input_dir, name)).st_mtime))
+                except FileNotFoundError:
+                    continue
+
+            # A pair is ready when both files are complete; a lone .h5 waits pair_timeout for its .pkl
+            # and is then triaged without it, even if a .pkl is still being written
+            ready = []
+            for name in list(complete):
+                if not name.endswith(".h5"):
+                    continue
+                pkl = name.replace(".h5", ".pkl")
+                if pkl in complete or now - complete[name] >= pair_timeout:
+                    ready.append((name, min(complete[name], complete.get(pkl, now)), pkl in complete))
+                    complete.pop(name)
+                    complete.pop(pkl, None)
+
+            # Forget a .pkl that is gone, or whose .h5 never showed up within pair_timeout
+            for name in list(complete):
+                if not name.endswith(".pkl"):
+                    continue
+                h5 = name.replace(".pkl", ".h5")
+                path = os.path.join(input_dir, name)
+                if not os.path.exists(path) or (h5 not in complete and not os.path.exists(os.path.join(input_dir, h5))
+                                                and now - complete[name] >= pair_timeout):
+                    complete.pop(name)
+
+            for file, first_complete, has_pkl in ready:
+                if not os.path.exists(os.path.join(input_dir, file)):
+                    continue
+                print(f"\n📥 {file} ready")
+                t0 = time.time()
+                result, error_type, normalized_error, fault = triage_model(file, input_dir, use_pkl=has_pkl)
+                triage_time = time.time() - t0
+
+                if result != "Success" and api_key:
+                    repair_model(api_key, file, error_type, normalized_error, fault)
+                final_stage = get_stage(file)
+
+                finished = time.time()
+                latency = finished - first_complete
+                latencies.append(latency)
+                verdict = {
+                    "model": file,
+                    "triage": "Success" if result == "Success" else error_type,
+                    "message": normalized_error,
+                    "stage": final_stage,
+                    "triage_time": round(triage_time, 4),
+                    "repair_time": round(finished - t0 - triage_time, 4),
+                    "latency": round(latency, 4),
+                    "finished": finished,
+                }
+                with open(verdict_path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(verdict, ensure_ascii=False) + "\n")
+                print(f"📝 {file}: {verdict['triage']} → {final_stage} ({latency:.2f}s end-to-end)")
+                print_stats(latencies, started)
+
+            if max_models and len(latencies) >= max_models:
+                break
+    except KeyboardInterrupt:
+        print("\n🛑 Watch stopped")
+    finally:
+        if fd is not None:
+            os.close(fd)
+        print_stats(latencies, started)
+    return latencies
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Repair test scripts continuously as a fuzzer emits them")
+    parser.add_argument("input_dir", nargs="?", default="input_files")
+    parser.add_argument("--interval", type=float, default=1.0, help="poll / event wait interval in seconds")
+    parser.add_argument("--pair-timeout", type=float, default=30.0,
+                        help="seconds to wait for the .pkl of a complete .h5 before triaging it alone")
+    parser.add_argument("--poll", action="store_true", help="force the polling fallback instead of inotify")
+    parser.add_argument("--max-models", type=int, default=None, help="exit after this many verdicts")
+    parser.add_argument("--no-repair", action="store_true", help="only triage, do not call the LLM")
+    args = parser.parse_args()
+
+    api_key = None if args.no_repair else os.environ.get("OPENAI_API_KEY")
+    if not api_key and not args.no_repair:
+        print("⚠️ OPENAI_API_KEY is not set, running triage only")
+    watch(args.input_dir, api_key, args.interval, args.pair_timeout,
+          use_inotify=not args.poll, max_models=args.max_models)
@@ -0,0 +1,177 @@
+import os
+import sys
+import json
+import time
+import struct
+import numpy as np
+
+# Consolidated weight pack for MUFFIN models: all initial_weights/<layer>.npz arrays of a
+# model in one file, laid out as [aligned raw arrays][JSON index][index offset][magic],
+# so the converter memory-maps it once and hands out zero-copy views per layer.
+PACK_NAME = "weights.pack"
+PACK_MAGIC = b"DWPACK01"
+ALIGN = 64
+_TRAILER = struct.Struct("<Q8s")
+
+
+def pack_path_for(weight_dir):
+    return os.path.join(os.path.dirname(os.path.abspath(weight_dir)), PACK_NAME)
+
+
+# Size and mtime of every .npz in `weight_dir`, as recorded in the pack index
+def _source_listing(weight_dir):
+    listing = {}
+    for file in sorted(os.listdir(weight_dir)):
+        if file.endswith(".npz"):
+            st = os.stat(os.path.join(weight_dir, file))
+            listing[file] = [st.st_size, st.st_mtime_ns]
+    return listing
+
+
+# Merge every per-layer .npz of `weight_dir` into a single pack file
+def pack_weights(weight_dir, pack_path=None):
+    pack_path = pack_path or pack_path_for(weight_dir)
+    # Listed before reading, so a file rewritten while packing makes the next check rebuild
+    index = {"layers": {}, "fallback": [], "sources": _source_listing(weight_dir)}
+    offset = 0
+    tmp_path = f"{pack_path}.{os.getpid()}.tmp"
+
+    with open(tmp_path, "wb") as out:
+        for file in sorted(os.listdir(weight_dir)):
+            if not file.endswith(".npz"):
+                continue
+            lname = file[:-len(".npz")]
+            entries = []
+            try:
+                with np.load(os.path.join(weight_dir, file), allow_pickle=False) as data:
+                    for key in sorted(data.files):
+                        arr = np.ascontiguousarray(data[key])
+                        pad = -offset % ALIGN
+                        out.write(b"\0" * pad)
+                        offset += pad
+                        out.write(arr.tobytes())
+                        entries.append({"key": key, "offset": offset, "shape": list(arr.shape), "dtype": arr.dtype.str})
+                        offset += arr.nbytes
+            except ValueError:
+                # Object arrays need pickle and cannot be mapped; the converter reads their .npz
+                index["fallback"].append(lname)
+                continue
+            index["layers"][lname] = entries
+
+        index_bytes = json.dumps(index).encode("utf-8")
+        out.write(index_bytes)
+        out.write(_TRAILER.pack(offset, PACK_MAGIC))
+
+    os.replace(tmp_path, pack_path)
+    return pack_path
+
+
+# Build the pack if it is missing, unreadable, or made from a different set of .npz files
+# than the folder holds now (added, removed, resized or touched)
+def ensure_pack(weight_dir):
+    pack_path = pack_path_for(weight_dir)
+    if os.path.exists(pack_path):
+        try:
+            mm, index = open_pack(pack_path)
+            del mm
+        except (OSError, ValueError, struct.error) as e:
+            print(f"⚠️ Rebuilding unreadable weight pack {pack_path}: {e}")
+            index = {}
+        if index.get("sources") == _source_listing(weight_dir):
+            return pack_path
+    return pack_weights(weight_dir, pack_path)
+
+
+# Memory-map a pack; returns (buffer, index)
+def open_pack(pack_path):
+    mm = np.memmap(pack_path, dtype=np.uint8, mode="r")
+    index_offset, magic = _TRAILER.unpack(bytes(mm[-_TRAILER.size:]))
+    if magic != PACK_MAGIC:
+        raise ValueError(f"{pack_path} is not a weight pack")
+    index = json.loads(bytes(mm[index_offset:len(mm) - _TRAILER.size]))
+    return mm, index
+
+
+# Read-only views into the mapped file, in the same order as sorted(npz.files)
+def layer_weights(mm, entries):
+    return [np.ndarray(tuple(e["shape"]), dtype=np.dtype(e["dtype"]), buffer=mm, offset=e["offset"])
+            for e in entries]
+
+
+# Runs in a fresh interpreter: convert one model on one path and report time and peak RSS
+def _convert_once(source_root, model_name, path, output_dir):
+    import resource
+    import mfh5
+
+    mfh5.source_root = source_root
+    mfh5.output_root = output_dir
+    baseline_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # after importing TF
+    t0 = time.perf_counter()
+    loaded = mfh5.convert_model(model_name, use_pack=(path == "pack"))
+    elapsed = time.perf_counter() - t0
+    peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(json.dumps({"time": round(elapsed, 4), "peak_rss_mb": round(peak_mb, 1),
+                      "baseline_rss_mb": round(baseline_mb, 1), "loaded": loaded[0] if loaded else None,
+                      "failed": loaded[1] if loaded else None}))
+
+
+# Compare whole convert_model runs on the per-layer .npz path and the pack path. Each run
+# is a fresh process so peak RSS covers the mapped pack pages and neither path warms the other
+def benchmark(source_root="./muffin_files", report_path="weight_pack_bench.json"):
+    import subprocess
+    import tempfile
+
+    results = {}
+    for model_name in sorted(os.listdir(source_root)):
+        model_dir = os.path.join(source_root, model_name)
+        json_path = os.path.join(model_dir, "model.json")
+        weight_dir = os.path.join(model_dir, "initial_weights")
+        if not os.path.exists(json_path) or not os.path.exists(weight_dir):
+            continue
+
+        t0 = time.perf_counter()
+        pack_weights(weight_dir)
+        pack_time = time.perf_counter() - t0
+
+        row = {"packing_time": round(pack_time, 4), "pack_mb": round(os.path.getsize(pack_path_for(weight_dir)) / 2 ** 20, 2)}
+        with tempfile.TemporaryDirectory() as output_dir:
+            for label in ("npz", "pack"):
+                proc = subprocess.run([sys.executable, os.path.abspath(__file__), "_convert",
+                                       source_root, model_name, label, output_dir],
+                                      capture_output=True, text=True)
+                lines = proc.stdout.strip().splitlines()
+                if proc.returncode != 0 or not lines:
+                    error = (proc.stderr.strip().splitlines() or ["no output"])[-1]
+                    print(f"❌ {label} conversion of {model_name} failed: {error}")
+                    row[f"{label}_error"] = error
+                    continue
+                for key, value in json.loads(lines[-1]).items():
+                    row[f"{label}_{key}"] = value
+        results[model_name] = row
+        if "npz_time" in row and "pack_time" in row:
+            print(f"⏱ {model_name}: npz {row['npz_time']:.3f}s / {row['npz_peak_rss_mb']}MB peak RSS, "
+                  f"pack {row['pack_time']:.3f}s / {row['pack_peak_rss_mb']}MB peak RSS (packing took {pack_time:.3f}s)")
+
+    timed = [r for r in results.values() if "npz_time" in r and "pack_time" in r]
+    if timed:
+        npz_total = sum(r["npz_time"] for r in timed)
+        pack_total = sum(r["pack_time"] for r in timed)
+        print(f"📊 {len(timed)} models: npz {npz_total:.2f}s, pack {pack_total:.2f}s "
+              f"({npz_total / pack_total if pack_total else float('inf'):.1f}x)")
+    with open(report_path, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    return results
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "_convert":
+        _convert_once(*sys.argv[2:6])
+    elif len(sys.argv) > 1 and sys.argv[1] == "bench":
+        benchmark(*sys.argv[2:3])
+    else:
+        # Pack every model under muffin_files (or the given root) ahead of conversion
+        source_root = sys.argv[1] if len(sys.argv) > 1 else "./muffin_files"
+        for model_name in sorted(os.listdir(source_root)):
+            weight_dir = os.path.join(source_root, model_name, "initial_weights")
+            if os.path.isdir(weight_dir):
+                print(f"📦 Packed {model_name}: {pack_weights(weight_dir)}")
@@ -0,0 +1,332 @@
+import os
+import sys
+import json
+import time
+import socket
+import sqlite3
+import argparse
+import threading
+import subprocess
+from collections import defaultdict
+
+# Coordinator/worker mode backed by a SQLite task queue. The coordinator enqueues one
+# phase at a time and waits for it; workers on any host sharing the database, the
+# input folder and the artifact store lease tasks, heartbeat them and report results.
+# The pipeline modules are imported where they are used, so the queue itself runs without Keras.
+QUEUE_DB = "delta_queue.db"
+LEASE_SECONDS = 120
+MAX_ATTEMPTS = 3
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tasks (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    phase TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    worker TEXT,
+    lease_expires REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    result TEXT
+);
+CREATE INDEX IF NOT EXISTS tasks_status ON tasks (status, id);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+"""
+
+
+def connect(db_path=QUEUE_DB):
+    conn = sqlite3.connect(db_path, timeout=60, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def set_meta(conn, key, value):
+    conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+
+def get_meta(conn, key):
+    row = conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+    return row[0] if row else None
+
+
+def enqueue(conn, phase, tasks):
+    conn.execute("BEGIN IMMEDIATE")
+    conn.executemany("INSERT INTO tasks (phase, kind, payload) VALUES (?, ?, ?)",
+                     [(phase, kind, json.dumps(payload)) for kind, payload in tasks])
+    conn.execute("COMMIT")
+
+
+# Take the oldest pending task, or one whose lease has expired; returns (id, kind, payload) or None
+def lease(conn, worker_id, lease_seconds=LEASE_SECONDS):
+    while True:
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        row = conn.execute(
+            "SELECT id, kind, payload, attempts, status FROM tasks "
+            "WHERE status = 'pending' OR (status = 'leased' AND lease_expires < ?) ORDER BY id LIMIT 1",
+            (now,)).fetchone()
+        if row is None:
+            conn.execute("COMMIT")
+            return None
+
+        task_id, kind, payload, attempts, status = row
+        if attempts >= MAX_ATTEMPTS:
+            conn.execute("UPDATE tasks SET status = 'failed', result = ? WHERE id = ?",
+                         (json.dumps({"error": f"gave up after {attempts} attempts"}), task_id))
+            conn.execute("COMMIT")
+            continue
+
+        if status == "leased":
+            print(f"♻️ Requeuing task {task_id}: lease expired")
+        conn.execute("UPDATE tasks SET status = 'leased', worker = ?, lease_expires = ?, attempts = attempts + 1 "
+                     "WHERE id = ?", (worker_id, now + lease_seconds, task_id))
+        conn.execute("COMMIT")
+        return task_id, kind, json.loads(payload)
+
+
+def heartbeat(conn, task_id, worker_id, lease_seconds=LEASE_SECONDS):
+    cur = conn.execute("UPDATE tasks SET lease_expires = ? WHERE id = ? AND worker = ? AND status = 'leased'",
+                       (time.time() + lease_seconds, task_id, worker_id))
+    return cur.rowcount == 1
+
+
+# Results of a worker that lost its lease to another worker are dropped
+def complete(conn, task_id, worker_id, result):
+    cur = conn.execute("UPDATE tasks SET status = 'done', result = ?, lease_expires = NULL "
+                       "WHERE id = ? AND worker = ? AND status = 'leased'",
+                       (json.dumps(result), task_id, worker_id))
+    return cur.rowcount == 1
+
+
+def fail(conn, task_id, worker_id, error):
+    conn.execute("UPDATE tasks SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, "
+                 "result = ?, lease_expires = NULL WHERE id = ? AND worker = ? AND status = 'leased'",
+                 (MAX_ATTEMPTS, json.dumps({"error": error}), task_id, worker_id))
+
+
+def _heartbeat_loop(db_path, task_id, worker_id, lease_seconds, stop):
+    conn = connect(db_path)
+    while not stop.wait(lease_seconds / 3):
+        if not heartbeat(conn, task_id, worker_id, lease_seconds):
+            print(f"⚠️ Lost the lease on task {task_id}")
+            break
+    conn.close()
+
+
+# -------- Task execution (worker side) -------- #
+def run_task(kind, payload, api_key):
+    from input_process import triage_model
+    from input_generation import process_no_input_model
+    from api import generate_repair
+    from code_process import repair_from_script
+
+    if kind == "triage":
+        result, error_type, message, fault = triage_model(payload["file"], payload["input_dir"])
+        return {"result": result, "error_type": error_type, "message": message, "fault": fault}
+    if kind == "input":
+        return {"result": process_no_input_model(api_key, payload["model_file"], attempt=payload.get("attempt", 0))}
+    if kind == "repair":
+        return {"path": generate_repair(api_key, payload["error_type"], payload["error_code"],
+                                        payload["message"], payload["repair_dir"], payload.get("fault"),
+                                        payload.get("attempt", 0))}
+    if kind == "validate":
+        failure = repair_from_script(payload["file"], payload["repair_path"],
+                                     failure_dir=payload["failure_dir"],
+                                     failure_info_path=payload["failure_info_path"])
+        return {"error_type": failure[0], "message": failure[1], "fault": failure[2]} if failure else {"error_type": None}
+    raise ValueError(f"Unknown task kind: {kind}")
+
+
+def work(db_path=QUEUE_DB, worker_id=None, lease_seconds=LEASE_SECONDS, poll=1.0):
+    worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+    api_key = os.environ.get("OPENAI_API_KEY")
+    conn = connect(db_path)
+    done = 0
+    joined = None  # campaign this worker has seen running
+    print(f"🛠 Worker {worker_id} started")
+
+    while True:
+        task = lease(conn, worker_id, lease_seconds)
+        if task is None:
+            # A `finished` left by an earlier campaign must not stop a worker started before the next one
+            state, campaign = get_meta(conn, "state"), get_meta(conn, "campaign")
+            if state == "running":
+                if joined is None:
+                    print(f"🛠 Worker {worker_id} joined campaign {campaign}")
+                joined = campaign
+            elif state == "finished" and joined is not None and campaign == joined:
+                break
+            time.sleep(poll)
+            continue
+
+        task_id, kind, payload = task
+        stop = threading.Event()
+        beat = threading.Thread(target=_heartbeat_loop, args=(db_path, task_id, worker_id, lease_seconds, stop),
+                                daemon=True)
+        beat.start()
+        try:
+            result = run_task(kind, payload, api_key)
+            if complete(conn, task_id, worker_id, result):
+                done += 1
+        except Exception as e:
+            print(f"❌ Task {task_id} ({kind}) failed: {e}")
+            fail(conn, task_id, worker_id, f"{type(e).__name__}: {e}")
+        finally:
+            stop.set()
+            beat.join()
+
+    conn.close()
+    print(f"🛠 Worker {worker_id} finished, {done} tasks completed")
+
+
+# -------- Coordination -------- #
+# Enqueue a phase and block until every task in it is done or failed; results keep enqueue order
+def run_phase(conn, phase, tasks, poll=1.0, idle_warning=60):
+    if tasks:
+        enqueue(conn, phase, tasks)
+    last = None
+    last_change = time.time()
+    while True:
+        counts = dict(conn.execute("SELECT status, COUNT(*) FROM tasks WHERE phase = ? GROUP BY status",
+                                   (phase,)).fetchall())
+        if counts != last:
+            print(f"📋 {phase}: " + ", ".join(f"{k} {v}" for k, v in sorted(counts.items())))
+            last = counts
+            last_change = time.time()
+        if not counts.get("pending") and not counts.get("leased"):
+            break
+        if not counts.get("leased") and time.time() - last_change >= idle_warning:
+            print(f"⏳ {phase}: {counts['pending']} tasks pending and no worker has taken one "
+                  f"for {idle_warning}s; start workers with `python work_queue.py worker`")
+            last_change = time.time()
+        time.sleep(poll)
+
+    rows = conn.execute("SELECT kind, payload, status, result FROM tasks WHERE phase = ? ORDER BY id",
+                        (phase,)).fetchall()
+    results = []
+    for kind, payload, status, result in rows:
+        if status == "failed":
+            print(f"❌ {kind} task gave up: {payload} → {result}")
+        results.append((json.loads(payload), json.loads(result) if status == "done" and result else None))
+    return results
+
+
+# One repair round, mirroring process_no_input_errors + run_error_repair + process_repair
+def _distributed_round(conn, tag, error_info_path, repair_dir, out_path,
+                       failure_dir=None, failure_info_path=None, attempt=0):
+    from input_process import format_error_dict
+
+    if not os.path.exists(error_info_path):
+        print(f"❌ {error_info_path} does not exist")
+        return
+    with open(error_info_path, "r", encoding="utf-8") as f:
+        error_info = json.load(f)
+
+    generation = []
+    validation = []
+    for error_type, group in error_info.items():
+        for error_code, data in group.items():
+            if error_type == "No Input Error":
+                generation += [("input", {"model_file": m, "attempt": attempt}) for m in data["models"]]
+                continue
+            generation.append(("repair", {"error_type": error_type, "error_code": error_code,
+                                          "message": data["message"], "repair_dir": repair_dir,
+                                          "fault": next(iter((data.get("faults") or {}).values()), None),
+                                          "attempt": attempt}))
+            validation += [("validate", {"file": m, "repair_path": os.path.join(repair_dir, f"{error_code}.py"),
+                                         "failure_dir": failure_dir, "failure_info_path": failure_info_path})
+                           for m in data["models"]]
+
+    run_phase(conn, f"{tag}-generate", generation)
+    error_dict = defaultdict(lambda: defaultdict(set))
+    faults = {}
+    for payload, result in run_phase(conn, f"{tag}-validate", validation):
+        if result is None:
+            error_dict["Other Error"]["Validation task failed"].add(payload["file"])
+        elif result["error_type"]:
+            error_dict[result["error_type"]][result["message"]].add(payload["file"])
+            faults[payload["file"]] = result.get("fault")
+
+    with open(out_path, "w", encoding="utf-8") as f:
+        json.dump(format_error_dict(error_dict, faults), f, indent=2, ensure_ascii=False)
+    print(f"✅ Repair attempts completed. Error records written to {out_path}")
+
+
+# Clear the previous campaign's tasks and mark a new one running, under a fresh id
+def start_campaign(conn):
+    campaign = f"{socket.gethostname()}-{os.getpid()}-{int(time.time())}"
+    conn.execute("BEGIN IMMEDIATE")
+    conn.execute("DELETE FROM tasks")
+    set_meta(conn, "campaign", campaign)
+    set_meta(conn, "state", "running")
+    conn.execute("COMMIT")
+    return campaign
+
+
+def coordinate(db_path=QUEUE_DB, input_dir="input_files", local_workers=0):
+    conn = connect(db_path)
+    print(f"📣 Campaign {start_campaign(conn)} running")
+    # Local workers start only once the campaign is running
+    workers = _spawn_local_workers(db_path, local_workers)
+    try:
+        _coordinate(conn, input_dir)
+    finally:
+        # Idle workers of this campaign exit once they see it is over
+        set_meta(conn, "state", "finished")
+        conn.close()
+        for p in workers:
+            p.wait()
+
+
+def _coordinate(conn, input_dir):
+    from input_process import format_error_dict
+    from artifact_store import list_stage
+
+    # Triage, then the same two repair rounds as run_full_pipeline
+    files = sorted({f for f in os.listdir(input_dir) if f.endswith(".h5")} | set(list_stage("input")))
+    error_dict = defaultdict(lambda: defaultdict(set))
+    faults = {}
+    for payload, result in run_phase(conn, "triage", [("triage", {"file": f, "input_dir": input_dir}) for f in files]):
+        if result is None:
+            # Reported like a failed validation task instead of dropping the model
+            error_dict["Other Error"]["Triage task failed"].add(payload["file"])
+        elif result["result"] != "Success":
+            error_dict[result["error_type"]][result["message"]].add(payload["file"])
+            faults[payload["file"]] = result.get("fault")
+    with open("error_info.json", "w", encoding="utf-8") as f:
+        json.dump(format_error_dict(error_dict, faults), f, indent=2, ensure_ascii=False)
+    print("Processing completed. Error information saved to error_info.json")
+
+    _distributed_round(conn, "round1", "error_info.json", "repairs", "fail_error_info.json")
+    _distributed_round(conn, "round2", "fail_error_info.json", "repairs2", "failure_info.json",
+                       failure_dir="failure_files", failure_info_path="failure_info.json", attempt=1)
+
+
+def _spawn_local_workers(db_path, count):
+    script = os.path.abspath(__file__)
+    return [subprocess.Popen([sys.executable, script, "worker", "--db", db_path, "--id", f"local-{i}"])
+            for i in range(count)]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Distribute triage and repair over a shared task queue")
+    sub = parser.add_subparsers(dest="role", required=True)
+
+    coord = sub.add_parser("coordinator")
+    coord.add_argument("--db", default=QUEUE_DB)
+    coord.add_argument("--input-dir", default="input_files")
+    coord.add_argument("--workers", type=int, default=0, help="also start this many local worker processes")
+
+    worker = sub.add_parser("worker")
+    worker.add_argument("--db", default=QUEUE_DB)
+    worker.add_argument("--id", default=None)
+    worker.add_argument("--lease", type=float, default=LEASE_SECONDS)
+
+    args = parser.parse_args()
+    if args.role == "coordinator":
+        start_time = time.time()
+        coordinate(args.db, args.input_dir, args.workers)
+        print(f"⏱ Total time: {time.time() - start_time:.2f} seconds")
+    else:
+        work(args.db, args.id, args.lease)